@@ -0,0 +1,222 @@
+import os
+os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+
+import csv
+import sys
+import glob
+import time
+import argparse
+import itertools
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from scripts.unit import ScoutUnit, SoldierUnit, HeavyUnit, Thumbtack, Toothpick, SewingNeedle, Match, PaperArmor, CardboardArmor, FoilArmor
+from scripts.item import Potion
+from scripts.battle import BattleState, read_level, spawn
+from scripts.pathing import FlowField
+from scripts.ai import UtilityPlanner
+
+# runs simulated battles for every level x party loadout and writes one csv row per battle:
+#   python balance.py -n 200 --csv balance.csv
+# the party always fights the same way, so comparing rows compares the numbers in scripts/unit.py
+
+WEAPONS = {"none": None, **{cls.__name__: cls for cls in (Thumbtack, Toothpick, SewingNeedle, Match)}}
+ARMORS = {"none": None, **{cls.__name__: cls for cls in (PaperArmor, CardboardArmor, FoilArmor)}}
+
+PARTY = [(ScoutUnit, "Milo"), (SoldierUnit, "Toto"), (HeavyUnit, "Grub")]
+
+FIELDS = ["level", "weapon", "armor", "seed", "winner", "rounds", "actions", "damage_dealt", "damage_taken", "hits", "misses", "protected", "survivors", "seconds"]
+
+# a round is a player turn and the enemy turn after it, what the game shows as "Turn N";
+# battles still going after this many are called a draw
+MAX_ROUNDS = 30
+
+def rounds(battle):
+    # battle.turn counts each side's turn, starting from 0
+    if battle.done:
+        return battle.turn // 2 + 1
+
+    return battle.turn // 2
+
+# a party member drinks a potion below this share of their health
+POTION_AT = 0.3
+
+def make_party(weapon, armor):
+    party = []
+
+    for cls, name in PARTY:
+        unit = cls(True, 0, 0, name)
+        unit.weapon = WEAPONS[weapon]() if WEAPONS[weapon] else None
+        unit.armor = ARMORS[armor]() if ARMORS[armor] else None
+        party.append(unit)
+
+    return party
+
+def choose(battle, planner, fields):
+    # the same planner on both sides, without a time budget so it's the same every run
+    if not battle.placed:
+        return battle.legal_actions()[0]
+
+    unit = battle.selected_unit
+    targets = battle.opponents()
+
+    if not battle.turn & 1 and unit.health < unit.max_health * POTION_AT and battle.inventory.get(Potion):
+        return ("item", Potion)
+
+    field = fields[battle.turn & 1]
+    field.update(targets, battle.solids)
+
+    decision = planner.plan(unit, battle.moves(), targets, None, field.dist, battle.attack_range)
+
+    if decision[0] == "move" and decision[1] is None:
+        return ("wait", None)
+
+    return decision
+
+def simulate(level, weapon, armor, seeds):
+    # one worker job: a run of battles with the same level and loadout
+    world_size, _, nature, enemies, *_, move_costs = read_level(level)
+    party = make_party(weapon, armor)
+
+    planner = UtilityPlanner(budget=float("inf"))
+
+    rows = []
+
+    for seed in seeds:
+        start = time.process_time()
+
+        members = [spawn(u) for u in party]
+        battle = BattleState(nature, world_size, enemies, members, {Potion: 3}, move_costs, seed)
+
+        fields = (FlowField(), FlowField())
+        turn = 0
+
+        dealt = taken = hits = misses = protected = actions = 0
+
+        while not battle.done and battle.turn < 2 * MAX_ROUNDS:
+            enemy_turn = battle.turn & 1
+
+            for kind, unit, d in battle.apply(choose(battle, planner, fields)):
+                match kind:
+                    case "hit":
+                        hits += 1
+                        if enemy_turn:
+                            taken += d
+                        else:
+                            dealt += d
+                    case "burn":
+                        if unit in members:
+                            taken += d
+                        else:
+                            dealt += d
+                    case "missed":
+                        misses += 1
+                    case "protected":
+                        protected += 1
+                    case "defeated":
+                        # the fallen mustn't stay something to walk towards
+                        for field in fields:
+                            field.invalidate()
+
+            actions += 1
+
+            if battle.turn != turn:
+                turn = battle.turn
+                for field in fields:
+                    field.invalidate()
+
+        rows.append({
+            "level": os.path.basename(level),
+            "weapon": weapon,
+            "armor": armor,
+            "seed": seed,
+            "winner": battle.winner or "draw",
+            "rounds": rounds(battle),
+            "actions": actions,
+            "damage_dealt": dealt,
+            "damage_taken": taken,
+            "hits": hits,
+            "misses": misses,
+            "protected": protected,
+            "survivors": len(battle.friendly_units),
+            "seconds": round(time.process_time() - start, 5),
+        })
+
+    return rows
+
+def summarize(rows):
+    # win rate, rounds and damage for each level and loadout
+    groups = {}
+    for row in rows:
+        groups.setdefault((row["level"], row["weapon"], row["armor"]), []).append(row)
+
+    print(f"{'level':<18}{'weapon':<14}{'armor':<16}{'n':>5}{'win':>7}{'draw':>6}{'rounds':>7}{'dealt p10/50/90':>20}{'taken p10/50/90':>20}")
+
+    for (level, weapon, armor), group in sorted(groups.items()):
+        wins = np.mean([r["winner"] == "player" for r in group])
+        draws = np.mean([r["winner"] == "draw" for r in group])
+        mean_rounds = np.mean([r["rounds"] for r in group])
+        dealt = np.percentile([r["damage_dealt"] for r in group], [10, 50, 90])
+        taken = np.percentile([r["damage_taken"] for r in group], [10, 50, 90])
+
+        print(f"{level:<18}{weapon:<14}{armor:<16}{len(group):>5}{wins:>7.0%}{draws:>6.0%}{mean_rounds:>7.1f}"
+              f"{'/'.join(f'{d:.0f}' for d in dealt):>20}{'/'.join(f'{d:.0f}' for d in taken):>20}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate battles for every level and party loadout.")
+    parser.add_argument("-n", "--battles", type=int, default=100, help="battles per level and loadout")
+    parser.add_argument("--levels", nargs="*", default=sorted(glob.glob(os.path.join("assets", "levels", "*.json"))))
+    parser.add_argument("--weapons", nargs="*", default=list(WEAPONS), choices=list(WEAPONS))
+    parser.add_argument("--armors", nargs="*", default=list(ARMORS), choices=list(ARMORS))
+    parser.add_argument("--seed", type=int, default=0, help="first seed, battle i uses seed + i")
+    parser.add_argument("--csv", default="balance.csv")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk", type=int, default=25, help="battles per job")
+    args = parser.parse_args()
+
+    seeds = list(range(args.seed, args.seed + args.battles))
+
+    jobs = [
+        (level, weapon, armor, seeds[i:i + args.chunk])
+        for level, weapon, armor in itertools.product(args.levels, args.weapons, args.armors)
+        for i in range(0, len(seeds), args.chunk)
+    ]
+
+    total = len(args.levels) * len(args.weapons) * len(args.armors) * len(seeds)
+
+    rows = []
+    start = time.perf_counter()
+
+    with open(args.csv, "w", newline="") as f, ProcessPoolExecutor(args.workers) as pool:
+        writer = csv.DictWriter(f, FIELDS)
+        writer.writeheader()
+
+        futures = [pool.submit(simulate, *job) for job in jobs]
+
+        # rows go out as each job finishes, so a long sweep can be watched or cut short
+        for future in as_completed(futures):
+            result = future.result()
+
+            writer.writerows(result)
+            f.flush()
+
+            rows += result
+
+            print(f"\r{len(rows)}/{total} battles", end="", file=sys.stderr, flush=True)
+
+    print(file=sys.stderr)
+
+    wall = time.perf_counter() - start
+    cpu = sum(r["seconds"] for r in rows)
+
+    summarize(rows)
+
+    print()
+    print(f"{len(rows)} battles in {wall:.1f}s on {args.workers} workers: "
+          f"{len(rows) / wall:.1f} battles/s, {len(rows) / wall / args.workers:.1f} battles/s per core, "
+          f"{len(rows) / max(cpu, 1e-9):.1f} battles per cpu second")
+    print(f"wrote {args.csv}")
+
+if __name__ == "__main__":
+    main()
@@ -255,11 +255,11 @@ def main():
                 case 'bori':
                     units.append(Bori(True, u['x'], u['y']))
 
-        return world_size, level, nature, units, data['during_battle_dialogue'], data['post_battle_dialogue'], data['available_sidequests'], data['next_level']
+        return world_size, level, nature, units, data['during_battle_dialogue'], data['post_battle_dialogue'], data['available_sidequests'], data['next_level'], data.get('move_costs')
 
     cam = pygame.Vector2(6, -4)
 
-    world_size, level, nature, units, during_dialogue, dialogue, sidequests, next_level = level_from_file(askopenfilename())
+    world_size, level, nature, units, during_dialogue, dialogue, sidequests, next_level, move_costs = level_from_file(askopenfilename())
 
     run = True
     while run:
@@ -311,6 +311,9 @@ def main():
                             "next_level": next_level
                         }
 
+                        if move_costs:
+                            data["move_costs"] = move_costs
+
                         json.dump(data, f, indent='\t')
                         f.close()
 
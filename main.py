@@ -3,21 +3,30 @@ VERSION = "0.0.2"
 import pygame
 import random
 import os
-import json
 
 import glob
 
 import math
-import numpy as np
+import sys
+import time
 
-from scripts.character import character_from_file
+from scripts.character import character_from_file, BODY_CACHE, FRAME_CACHE
 from scripts.unit import *
 from scripts.dialogue import DialogueManager
 from scripts.item import *
 from scripts.particle import Particle
-from scripts.constants import DamageType
+from scripts.terrain import TerrainLayer
+from scripts.text import TextCache
+from scripts.background import DotPattern
+from scripts.surfaces import SurfacePool
+from scripts.compositor import DirtyRectCompositor
+from scripts.pathing import ReachabilityCache, SolidsMap, FlowField, movement_kind
+from scripts.ai import UtilityPlanner, AIWorker
+from scripts.influence import InfluenceMap
+from scripts.attack import AttackRange
+from scripts.battle import read_level, resolve_attack, burn, kill_reward, new_seed
+from scripts.replay import ReplayWriter, read_replay
 
-from tcod import path
 
 all_levels = [
     ("Tutorial", "level1.json"),
@@ -93,6 +102,17 @@ character_buffer = []
 
 OUTLINE = True
 PAPERTEX = False
+SHOW_STATS = False
+
+# only push changed regions to the window while the menus sit still
+DIRTY_RECTS = True
+
+# enemies think on a worker thread, or in small slices per frame where threads aren't available
+AI_THREADED = sys.platform != "emscripten"
+
+# every battle is written to REPLAY_DIR as a command log; python main.py --replay <file> plays one back
+RECORD_REPLAYS = sys.platform != "emscripten"
+REPLAY_DIR = "replays"
 
 pygame.init()
 
@@ -126,10 +146,20 @@ for y in range(0, HEIGHT):
 
 b_width = 1
 
+# the scrolling dots darken whatever background they're drawn over by 10%
+DOTS = DotPattern((WIDTH, HEIGHT))
+
 PG_CE_POWERED = pygame.image.load(os.path.join('assets', 'visual', 'pygame_ce_powered_lowres.webp')).convert_alpha()
 
 _tex = pygame.image.load(os.path.join('assets', 'visual', 'paper.png')).convert()
 
+# persistent scratch surfaces, so steady-state frames don't allocate
+SURFACES = SurfacePool()
+
+# the caches tell the pool when they render, so the stats line counts every surface a frame makes
+TEXT_CACHE = TextCache(512, SURFACES)
+BODY_CACHE.pool = FRAME_CACHE.pool = SURFACES
+
 def clamp(value, min_value, max_value):
     return max(min_value, min(value, max_value))
 
@@ -167,76 +197,94 @@ def darken(color, value=0.2):
     c = pygame.Color(color)
     return (c.r * (1 - value), c.g * (1 - value), c.b * (1 - value))
 
-def draw_tile(x, y, color, border=False):
+def draw_text(win, font, text, color, x, y, shadow=0, anchor=(0, 0)):
+    t = TEXT_CACHE.render(font, text, color, shadow)
+
+    w, h = t.get_width() - shadow, t.get_height() - shadow
+    x -= int(w * anchor[0])
+    y -= int(h * anchor[1])
+
+    win.blit(t, (x, y))
+
+    return pygame.Rect(x, y, w, h)
+
+def draw_tile(x, y, color, border=False, win=None):
+    if win is None: win = screen
+
     i, j = from_world_pos(x, y)
     if not border:
-        pygame.draw.polygon(screen, darken(color, 0.4), [
+        pygame.draw.polygon(win, darken(color, 0.4), [
             (i, j + TILE_SIZE[1] / 2),
             (i, j + TILE_SIZE[1] * 1.5),
             (i + TILE_SIZE[0] / 2, j + TILE_SIZE[1] * 2.0),
             (i + TILE_SIZE[0] / 2, j + TILE_SIZE[1]),
         ])
 
-        pygame.draw.polygon(screen, darken(color, 0.2), [
+        pygame.draw.polygon(win, darken(color, 0.2), [
             (i + TILE_SIZE[0] / 2, j + TILE_SIZE[1]),
             (i + TILE_SIZE[0] / 2, j + TILE_SIZE[1] * 2.0),
             (i + TILE_SIZE[0], j + TILE_SIZE[1] * 1.5),
             (i + TILE_SIZE[0], j + TILE_SIZE[1] / 2),
         ])
 
-        pygame.draw.polygon(screen, color, [
+        pygame.draw.polygon(win, color, [
             (i + TILE_SIZE[0] / 2, j),
             (i + TILE_SIZE[0], j + TILE_SIZE[1] / 2),
             (i + TILE_SIZE[0] / 2, j + TILE_SIZE[1]),
             (i, j + TILE_SIZE[1] / 2),
         ])
     else:
-        pygame.draw.polygon(screen, darken(color, 0.4), [
+        pygame.draw.polygon(win, darken(color, 0.4), [
             (i, j + TILE_SIZE[1] / 2),
             (i, j + TILE_SIZE[1] * 1.5),
             (i + TILE_SIZE[0] / 2, j + TILE_SIZE[1] * 2.0),
             (i + TILE_SIZE[0] / 2, j + TILE_SIZE[1]),
         ], b_width)
 
-        pygame.draw.polygon(screen, darken(color, 0.2), [
+        pygame.draw.polygon(win, darken(color, 0.2), [
             (i + TILE_SIZE[0] / 2, j + TILE_SIZE[1]),
             (i + TILE_SIZE[0] / 2, j + TILE_SIZE[1] * 2.0),
             (i + TILE_SIZE[0], j + TILE_SIZE[1] * 1.5),
             (i + TILE_SIZE[0], j + TILE_SIZE[1] / 2),
         ], b_width)
 
-        pygame.draw.polygon(screen, color, [
+        pygame.draw.polygon(win, color, [
             (i + TILE_SIZE[0] / 2, j),
             (i + TILE_SIZE[0], j + TILE_SIZE[1] / 2),
             (i + TILE_SIZE[0] / 2, j + TILE_SIZE[1]),
             (i, j + TILE_SIZE[1] / 2),
         ], b_width)
 
-def draw_tile_flat(x, y, color, border=False):
+def draw_tile_flat(x, y, color, border=False, win=None):
+    if win is None: win = screen
+
     i, j = from_world_pos(x, y)
     if not border:
-        pygame.draw.polygon(screen, color, [
+        pygame.draw.polygon(win, color, [
             (i + TILE_SIZE[0] / 2, j),
             (i + TILE_SIZE[0], j + TILE_SIZE[1] / 2),
             (i + TILE_SIZE[0] / 2, j + TILE_SIZE[1]),
             (i, j + TILE_SIZE[1] / 2),
         ])
     else:
-        pygame.draw.polygon(screen, color, [
+        pygame.draw.polygon(win, color, [
             (i + TILE_SIZE[0] / 2, j),
             (i + TILE_SIZE[0], j + TILE_SIZE[1] / 2),
             (i + TILE_SIZE[0] / 2, j + TILE_SIZE[1]),
             (i, j + TILE_SIZE[1] / 2),
         ], b_width)
 
-def draw_small_tile(x, y, color):
+def draw_small_tile(x, y, color, win=None):
+    if win is None: win = screen
+
     i, j = from_world_pos(x, y)
     w, h = TILE_SIZE[0] * 0.8, TILE_SIZE[1] * 0.8
     
     i += TILE_SIZE[0] * 0.1
     j += TILE_SIZE[1] * 0.1
 
-    surf = pygame.Surface((w, h), pygame.SRCALPHA)
+    surf = SURFACES.get("small_tile", (w, h), pygame.SRCALPHA)
+    surf.fill((0, 0, 0, 0))
 
     pygame.draw.polygon(surf, color, [
         (0 + w / 2, 0),
@@ -247,7 +295,7 @@ def draw_small_tile(x, y, color):
 
     surf.set_alpha(128)
 
-    screen.blit(surf, (i, j))
+    win.blit(surf, (i, j))
 
 def draw_tree(x, y):
     i, j = from_world_pos(x, y)
@@ -320,20 +368,6 @@ def draw_star(win, x, y, scale=10, rotation=0, col='lightyellow'):
 
     pygame.draw.polygon(win, col, [[p[0] + x, p[1] + y] for p in points])
 
-def GenerateSolidsMap(input_map, units_input, world_width=10, world_height=10):
-    solids = np.array([[ 0 for _ in range(world_width) ] for _ in range(world_height)])
-    solids[:] = True
-
-    for x in range(world_width):
-        for y in range(world_height):
-            if input_map[y * world_width + x] not in [0, 4]:
-                solids[y, x] = False
-            for unit in units_input:
-                if int(unit.x) == x and int(unit.y) == y:
-                    solids[y, x] = False
-    
-    return solids
-
 def play_tap_sound():
     SOUNDS[f"tap{random.randint(1, 3)}"].play()
 
@@ -358,52 +392,38 @@ def main():
 
     main_menu_loadin = 1.0
 
-    main_menu = True
-    splash_screen = 4.0
+    # a recorded battle to play back, straight in without the menus
+    replay = read_replay(sys.argv[sys.argv.index("--replay") + 1]) if "--replay" in sys.argv else None
+
+    # what's left of it, and a little pause between its actions so they can be followed
+    replay_queue = list(replay.actions) if replay else []
+    replay_timer = 0.0
+
+    main_menu = not replay
+    splash_screen = 0.0 if replay else 4.0
 
     cam = pygame.Vector2(6, -4)
 
     selected_pos = (0, 0)
 
     def level_from_file(f):
-        world_size = (0, 0)
-        level = ""
-        nature = []
-        units = []
+        level = read_level(f)
 
-        data = {}
+        if PAPERTEX:
+            for u in level[3]:
+                u.character.prepare_texture(_tex)
 
-        with open(f, 'r') as file:
-            data = json.load(file)
-            file.close()
-        
-        world_size = (data['width'], data['height'])
-
-        level = data['schema']
+        return level
 
-        for y in range(world_size[1]):
-            for x in range(world_size[0]):
-                nature.append(data['scenery'][y][x])
-            
-        for u in data['units']:
-            match u['type']:
-                case 'scout':
-                    units.append(ScoutUnit(True, u['x'], u['y']))
-                case 'soldier':
-                    units.append(SoldierUnit(True, u['x'], u['y']))
-                case 'heavy':
-                    units.append(HeavyUnit(True, u['x'], u['y']))
-                case 'bori':
-                    units.append(Bori(True, u['x'], u['y']))
-
-        return world_size, level, nature, units, data['during_battle_dialogue'], data['post_battle_dialogue'], data['available_sidequests'], data['next_level'], data['reward']
-
-    current_level = 0
+    current_level = [filename for _, filename in all_levels].index(replay.level) if replay else 0
 
     level_name, level_filename = all_levels[current_level]
 
+    if replay:
+        character_buffer = list(replay.party)
+
     # schemas are forest, mountain, desert, icy, and chaos
-    world_size, schema, nature, enemy_units, thru_dialogue, end_dialogue, available_sidequests, next_level, level_reward = level_from_file(os.path.join("assets", "levels", level_filename))
+    world_size, schema, nature, enemy_units, thru_dialogue, end_dialogue, available_sidequests, next_level, level_reward, move_costs = level_from_file(os.path.join("assets", "levels", level_filename))
 
     friendly_units = []
     
@@ -419,13 +439,42 @@ def main():
         Potion: 3
     }
 
-    c = GenerateSolidsMap(nature, units, world_size[0], world_size[1])
+    solids = SolidsMap(nature, world_size, move_costs)
+    attack_range = AttackRange(nature, world_size)
+
+    # every roll of a battle comes from its own stream, so it plays out the same from its seed
+    battle_seed = replay.seed if replay else new_seed()
+    battle_rng = random.Random(battle_seed)
+
+    if replay:
+        party_inventory = dict(replay.inventory)
+
+    def start_recording():
+        if not RECORD_REPLAYS or replay:
+            return None
 
-    graph = path.SimpleGraph(cost=c, cardinal=1, diagonal=0)
+        # the units placement will take, roster first
+        party = [character_buffer[i] if i < len(character_buffer) else character_classes[i](True, 0, 0, character_names[i]) for i in range(len(character_classes))]
 
-    c2 = GenerateSolidsMap(nature, enemy_units, world_size[0], world_size[1])
+        os.makedirs(REPLAY_DIR, exist_ok=True)
+        return ReplayWriter(os.path.join(REPLAY_DIR, time.strftime("%Y%m%d-%H%M%S") + ".ttr"), level_filename, battle_seed, party, party_inventory)
 
-    graph_enemies_only = path.SimpleGraph(cost=c2, cardinal=1, diagonal=0)
+    def record(action):
+        if recorder:
+            recorder.record(action)
+
+    def use_item(unit, k):
+        o = k().on_use(unit, None)
+        party_inventory[k] -= 1
+        if o:
+            add_text_popup(o[0], unit.x + cam.x, unit.y + cam.y, o[1])
+        unit.action_points -= 1
+
+    recorder = start_recording()
+
+    # enemies path around each other from where they started, but walk through the player
+    enemy_solids = SolidsMap(nature, world_size, move_costs)
+    enemy_solids.occupy(enemy_units)
 
     def mouse_to_tile_pos(ox=0, oy=0):
         mx, my = pygame.mouse.get_pos()
@@ -437,72 +486,91 @@ def main():
         return (x, y)
 
     def unit_path_to(unit, sx, sy, include_target=True): 
-        if unit in enemy_units:
-            finder = path.Pathfinder(graph_enemies_only)
-        else:
-            finder = path.Pathfinder(graph)
+        board = enemy_solids if unit in enemy_units else solids
 
         unit.target_x = sx
         unit.target_y = sy
 
-        finder.add_root((unit.y, unit.x))
-
-        unit.path = finder.path_to((sy, sx)).tolist()[1:]
+        unit.path = board.path_to(unit.x, unit.y, sx, sy, movement_kind(unit))
 
         if include_target:
             unit.path.append((sy, sx))
 
-    def draw_unit_move_grid(unit, cam_x, cam_y, graph):
-        finder = path.Pathfinder(graph)
+    reachability = ReachabilityCache()
 
-        finder.add_root((unit.y, unit.x))
-        
-        possible_moves = []
-
-        for x in range(-unit.max_move, unit.max_move + 1):
-            for y in range(-unit.max_move, unit.max_move + 1):
-                if 0 <= unit.x + x < world_size[0] and 0 <= unit.y + y < world_size[1]:    
-                    try:
-                        try:
-                            p = finder.path_to((unit.y + y, unit.x + x)).tolist()[1:]
-                            if 0 < len(p) <= unit.max_move:
-                                possible_moves.append((unit.x + x, unit.y + y))
-
-                                draw_small_tile(unit.x + x + cam_x, unit.y + y + cam_y, "cyan")
-                        except RuntimeError:
-                            pass
-                    except IndexError:
-                        pass
+    def draw_unit_move_grid(unit, cam_x, cam_y, solids, draw=True):
+        possible_moves = reachability.reachable(solids, int(unit.x), int(unit.y), unit.max_move, movement_kind(unit))
+
+        if draw:
+            for x, y in possible_moves:
+                draw_small_tile(x + cam_x, y + cam_y, "cyan")
 
         return possible_moves
 
-    def get_grid_of_size(unit, size=1):
-        possible_moves = []
+    terrain_layer = TerrainLayer((WIDTH, HEIGHT))
+
+    # tiles that still need drawing every frame, in painter's order
+    water_tiles = []
+    scenery_tiles = []
+
+    def scan_scenery():
+        water_tiles.clear()
+        scenery_tiles.clear()
+
+        for x in range(world_size[0]):
+            for y in range(world_size[1]):
+                n = nature[y * world_size[0] + x]
+
+                if n in [3, 4]: # water or bridge
+                    water_tiles.append((x, y))
+                elif n in [1, 2, 16]: # tree, rock or placement tile
+                    scenery_tiles.append((x, y, n))
+
+        terrain_layer.invalidate()
+
+    scan_scenery()
 
-        for x in range(-size, size + 1):
-            for y in range(-size, size + 1):
-                if x == 0 and y == 0:
+    def bake_terrain(surf):
+        for x in range(world_size[0]):
+            for y in range(world_size[1]):
+                if nature[y * world_size[0] + x] in [3, 4]: # water or bridge
                     continue
-                if 0 <= unit.x + x < world_size[0] and 0 <= unit.y + y < world_size[1]:
-                    if abs(x) + abs(y) <= size:
-                        possible_moves.append((unit.x + x, unit.y + y))
 
-        return possible_moves
+                color = colors[0] if (x + y) % 2 == 0 else colors[1]
+                draw_tile(x + cam.x, y + cam.y, color, win=surf)
+                if OUTLINE: draw_tile(x + cam.x, y + cam.y, darken(color, 0.3), True, surf)
+
+    # what the player can hit (for the enemy planner) and what the enemies can hit (for the overlay)
+    player_threat = InfluenceMap()
+    enemy_threat = InfluenceMap()
+
+    # one field per enemy turn leading every enemy towards the player's units
+    enemy_flow = FlowField()
+
+    danger_layer = TerrainLayer((WIDTH, HEIGHT))
+    show_danger = False
+
+    def bake_danger(surf):
+        for x, y, n in enemy_threat.tiles():
+            draw_small_tile(x + cam.x, y + cam.y, "orange" if n == 1 else "red", surf)
 
     popups = []
 
     buttons = 0
 
     def add_text_popup(text, x, y, color="black"):
-        t = SMALL_FONT.render(str(text), True, color)
+        # popups fade out individually, so they get their own copy of the cached text
+        t = TEXT_CACHE.render(SMALL_FONT, str(text), color, 1).copy()
+        SURFACES.count()
         
         sx, sy = from_world_pos(x, y)
 
-        sx += TILE_SIZE[0] / 2 - t.get_width() / 2
+        sx += TILE_SIZE[0] / 2 - (t.get_width() - 1) / 2
 
         popups.append({
             "text": text,
             "color": color,
+            "surf": t,
             "x": sx,
             "y": sy,
             "time": 1.0
@@ -511,13 +579,14 @@ def main():
     def draw_button(scr, x, y, w, h, text):
         can_show_info = True
 
-        surf = pygame.Surface((w, h), pygame.SRCALPHA)
+        surf = SURFACES.get("button", (w, h), pygame.SRCALPHA)
+        surf.fill((0, 0, 0, 0))
         pygame.draw.polygon(surf, (0, 0, 0, 255), [
             (0, 0), (0 + w - 20, 0),
             (0 + w, 0 + h), (0, 0 + h)
         ])
 
-        surf.blit(SMALL_FONT.render(text, True, 'white'), (5, 3))
+        surf.blit(TEXT_CACHE.render(SMALL_FONT, text, 'white'), (5, 3))
 
         if not pygame.Rect(x, y, w, h).collidepoint(pygame.mouse.get_pos()):
             surf.set_alpha(128)
@@ -527,6 +596,8 @@ def main():
 
         scr.blit(surf, (x, y))
 
+        compositor.track(("button", x, y), (x, y, w, h), (can_show_info, text))
+
         pygame.draw.polygon(scr, 'white', [
             (x, y), (x + w - 20, y),
             (x + w, y + h), (x, y + h)
@@ -539,6 +610,11 @@ def main():
     allowed_moves = []
     allowed_attacks = []
 
+    hover_key = None
+
+    planner = UtilityPlanner()
+    ai_worker = AIWorker(planner, AI_THREADED)
+
     ap_w = 0
 
     selected_action = "none"
@@ -566,7 +642,7 @@ def main():
 
     menu = -1 # post battle seq
 
-    dialogue_manager = DialogueManager(FONT, BIG_FONT, 'white', 'white')
+    dialogue_manager = DialogueManager(FONT, BIG_FONT, 'white', 'white', SURFACES)
 
     for i in range(len(thru_dialogue[turn])):
         dialogue_manager.queue_text(thru_dialogue[turn][i])
@@ -582,15 +658,33 @@ def main():
         Match: 1
     }
 
+    compositor = DirtyRectCompositor()
+    dots_t = 0
+
+    def present():
+        if SHOW_STATS:
+            # changes every frame, so it skips the cache and isn't counted, or it would only ever measure itself
+            screen.blit(t := SMALL_FONT.render(f"{clock.get_fps():.0f} fps | {SURFACES.frame_allocations} allocs | text {TEXT_CACHE.hits}/{TEXT_CACHE.misses}", True, 'black'), (5, HEIGHT - t.get_height() - 5))
+            compositor.mark((0, HEIGHT - t.get_height() - 5, WIDTH, t.get_height() + 5))
+
+        SURFACES.end_frame()
+
+        compositor.present()
+
     button_reward = 100
     reward_falloff = 0.75
 
     def get_reward(n):
         return int(button_reward * pow(reward_falloff, n))
 
+    # set by the menus once nothing on screen is moving
+    idle = False
+
     run = True
     while run:
-        delta = clock.tick_busy_loop(60) / 1000.0
+        # an idle screen sleeps until the next frame instead of spinning a core on it
+        delta = (clock.tick(60) if idle else clock.tick_busy_loop(60)) / 1000.0
+        idle = False
 
         keys = pygame.key.get_pressed()
 
@@ -601,6 +695,9 @@ def main():
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 run = False
+            elif replay_queue and battling and event.type == pygame.MOUSEBUTTONDOWN:
+                # hands off while a replay is driving
+                pass
             else:
                 evs.append(event)
         
@@ -609,42 +706,35 @@ def main():
         splash_screen = max(0, splash_screen - delta)
 
         if splash_screen:
-            splash_screen_surf = pygame.Surface((WIDTH, HEIGHT))
+            compositor.mark_all()
+
+            splash_screen_surf = SURFACES.get("splash", (WIDTH, HEIGHT))
             splash_screen_surf.fill('mediumpurple')
             
-            t = pygame.time.get_ticks() / 150
-            t %= 50
-
-            for x in range(WIDTH // 50 + 1):
-                for y in range(HEIGHT // 50 + 1):
-                    if (x + y) % 2 == 0:
-                        fx, fy = 25 + x * 50 - t, 25 + y * 50 - t
-                        q = 1 - abs(2 * ((fx + fy) / (WIDTH + HEIGHT) - 0.5))
-                        r = 25 * pow(q, 1)
-                        pygame.draw.circle(splash_screen_surf, darken('mediumpurple', 0.1), (fx, fy), r)
+            DOTS.draw(splash_screen_surf, pygame.time.get_ticks() / 150)
 
             splash_screen_surf.blit(PG_CE_POWERED, (WIDTH - PG_CE_POWERED.get_width() - 5, HEIGHT - PG_CE_POWERED.get_height() - 5))
 
-            splash_screen_surf.blit(t := BIG_FONT.render("Toybox Tactics", True, 'black'), (2 + WIDTH // 2 - t.get_width() // 2, 2 + HEIGHT // 4 - t.get_height() // 2))
-            splash_screen_surf.blit(t := BIG_FONT.render("Toybox Tactics", True, 'white'), (WIDTH // 2 - t.get_width() // 2, HEIGHT // 4 - t.get_height() // 2))
+            t = draw_text(splash_screen_surf, BIG_FONT, "Toybox Tactics", 'white', WIDTH // 2, HEIGHT // 4, 2, (0.5, 0.5))
 
-            splash_screen_surf.blit(t := FONT.render("A Paper Opcode Game", True, 'black'), (1 + WIDTH // 2 - t.get_width() // 2, 1 + HEIGHT // 3 - t.get_height() // 2))
-            splash_screen_surf.blit(t := FONT.render("A Paper Opcode Game", True, 'white'), (WIDTH // 2 - t.get_width() // 2, HEIGHT // 3 - t.get_height() // 2))
+            t = draw_text(splash_screen_surf, FONT, "A Paper Opcode Game", 'white', WIDTH // 2, HEIGHT // 3, 1, (0.5, 0.5))
 
             screen.blit(splash_screen_surf, (0, 0))
-            black_screen = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
+            black_screen = SURFACES.get("fade", (WIDTH, HEIGHT))
             black_screen.fill('black')
             z = splash_screen / 4.0
             black_screen.set_alpha(int(255 * pow(2 * (z - 0.5), 2)))
             screen.blit(black_screen, (0, 0))
 
-            pygame.display.flip()
+            present()
             continue
 
         if sp:
             SOUNDS['maintheme'].play()
 
         if main_menu:
+            compositor.mark_all()
+
             for event in evs:
                 if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
                     w, h = 80, 30
@@ -658,43 +748,75 @@ def main():
 
             screen.fill('mediumpurple')
             
-            t = pygame.time.get_ticks() / 150
-            t %= 50
-
-            for x in range(WIDTH // 50 + 1):
-                for y in range(HEIGHT // 50 + 1):
-                    if (x + y) % 2 == 0:
-                        fx, fy = 25 + x * 50 - t, 25 + y * 50 - t
-                        q = 1 - abs(2 * ((fx + fy) / (WIDTH + HEIGHT) - 0.5))
-                        r = 25 * pow(q, 1)
-                        pygame.draw.circle(screen, darken('mediumpurple', 0.1), (fx, fy), r)
+            DOTS.draw(screen, pygame.time.get_ticks() / 150)
 
             screen.blit(PG_CE_POWERED, (WIDTH - PG_CE_POWERED.get_width() - 5, HEIGHT - PG_CE_POWERED.get_height() - 5))
 
-            screen.blit(t := BIG_FONT.render("Toybox Tactics", True, 'black'), (2 + WIDTH // 2 - t.get_width() // 2, 2 + HEIGHT // 4 - t.get_height() // 2))
-            screen.blit(t := BIG_FONT.render("Toybox Tactics", True, 'white'), (WIDTH // 2 - t.get_width() // 2, HEIGHT // 4 - t.get_height() // 2))
+            t = draw_text(screen, BIG_FONT, "Toybox Tactics", 'white', WIDTH // 2, HEIGHT // 4, 2, (0.5, 0.5))
 
             w, h = 80, 30
             s = 10
             draw_button(screen, WIDTH // 2 - w // 2, HEIGHT // 2 - h // 2 + (h + s) * 0, w, h, "Play")
             draw_button(screen, WIDTH // 2 - w // 2, HEIGHT // 2 - h // 2 + (h + s) * 1, w, h, "Quit")
 
-            screen.blit(t := SMALL_FONT.render(f"A Paper Opcode Game | v{VERSION}", True, 'white'), (5, HEIGHT - t.get_height() - 5))
+            screen.blit(t := TEXT_CACHE.render(SMALL_FONT, f"A Paper Opcode Game | v{VERSION}", 'white'), (5, HEIGHT - t.get_height() - 5))
 
-            black_screen = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
+            black_screen = SURFACES.get("fade", (WIDTH, HEIGHT))
             black_screen.fill('black')
             z = main_menu_loadin
             black_screen.set_alpha(int(255 * pow(z, 2)))
             screen.blit(black_screen, (0, 0))
 
-            pygame.display.flip()
+            present()
 
             continue
 
+        # a replay plays the player's side by standing in for their clicks
+        if replay_queue and battling:
+            replay_timer = max(0, replay_timer - delta)
+
+            if replay_timer <= 0:
+                kind, arg = replay_queue[0]
+
+                if dialogue_manager.has_dialogue():
+                    evs.append(pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=1, pos=(0, 0)))
+                    replay_timer = 0.5
+                elif not placed and kind == "place":
+                    replay_queue.pop(0)
+                    selected_pos = arg
+                    evs.append(pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=1, pos=(0, 0)))
+                    replay_timer = 0.3
+                elif placed and not turn & 1 and selected_action == "none" and animation_time <= 0:
+                    replay_queue.pop(0)
+
+                    match kind:
+                        case "move":
+                            selected_action = "move"
+                            unit_path_to(selected_unit, *arg)
+                            units_should_move = True
+                        case "attack":
+                            selected_action = "attack"
+                            allowed_attacks = attack_range.of(selected_unit)
+                            selected_pos = arg
+                            evs.append(pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=1, pos=(0, 0)))
+                        case "item":
+                            use_item(selected_unit, arg)
+                        case "wait":
+                            selected_unit.action_points = 0
+                            SOUNDS["unknown"].play()
+
+                    replay_timer = 0.3
+
         for event in evs:
             if event.type == pygame.KEYDOWN:
                 if battling:
+                    if event.key == pygame.K_d:
+                        show_danger = not show_danger
+
                     if event.key == pygame.K_SPACE:
+                        if recorder:
+                            recorder.close()
+
                         battling = False
                         won = True
                         curtain_timer = 2.0
@@ -716,29 +838,25 @@ def main():
                                 units_should_move = True
                         elif selected_action == "attack":
                             if selected_pos in allowed_attacks:
+                                record(("attack", selected_pos))
+
                                 for unit in units:
                                     if unit.x == selected_pos[0] and unit.y == selected_pos[1]:
                                         if unit != selected_unit:
                                             if unit.health > 0:
-                                                if random.random() <= selected_unit.calculate_hit_chance():
-                                                    if random.random() <= unit.calculate_protection_chance():
+                                                outcome, d = resolve_attack(selected_unit, unit, battle_rng)
+                                                if outcome != "missed":
+                                                    if outcome == "protected":
                                                         add_text_popup(f"Protected!", unit.x + cam.x, unit.y + cam.y, "forestgreen")
                                                     else:
-                                                        if selected_unit.weapon:
-                                                            d = selected_unit.weapon.damage
-                                                            if selected_unit.weapon.damage_type == DamageType.FIRE and random.random() <= 0.5:
-                                                                unit.onfire = True
-                                                        else:
-                                                            d = 0
-                                                        d += random.randint(0, selected_unit.strength)
-                                                        if unit.armor: d = max(0, d - random.randint(0, unit.armor.protection_value))
                                                         add_text_popup(f"-{d}", unit.x + cam.x, unit.y + cam.y, "brown1")
-                                                        unit.health -= d
                                                     if unit.health <= 0:
                                                         if unit in friendly_units:
                                                             friendly_units.remove(unit)
+                                                            enemy_flow.invalidate()
+                                                            player_threat.invalidate()
                                                         else:
-                                                            if selected_unit.give_xp(unit.xp_given):
+                                                            if selected_unit.give_xp(unit.xp_given, battle_rng):
                                                                 # true on level up
                                                                 add_text_popup(f"Level up!", selected_unit.x + cam.x, selected_unit.y + cam.y, "gold")
                                                                 messages.append(f"{selected_unit.name} leveled up!")
@@ -746,10 +864,12 @@ def main():
                                                                 add_text_popup(f"+{unit.xp_given} xp!", selected_unit.x + cam.x, selected_unit.y + cam.y, "gold")
                                                                 messages.append(f"{selected_unit.name} gained {unit.xp_given} xp!")
                                                             enemy_units.remove(unit)
+                                                            enemy_threat.invalidate()
 
-                                                            buttons += random.randint(6, 12)
+                                                            buttons += kill_reward(battle_rng)
 
                                                         units.remove(unit)
+                                                        solids.remove(unit.x, unit.y)
                                                         SOUNDS["smash"].play()
                                                     else:
                                                         play_tap_sound()
@@ -768,14 +888,12 @@ def main():
                             y -= selected_unit.character.scale
                             items = list(filter(lambda x: issubclass(x[0], Item), party_inventory.items()))
                             for i, (k, v) in enumerate(items):
-                                if pygame.Rect(x, y, w, h).collidepoint(pygame.mouse.get_pos()):
+                                # an empty stack stays listed but can't be used, same as BattleState.apply
+                                if pygame.Rect(x, y, w, h).collidepoint(pygame.mouse.get_pos()) and v > 0:
                                     if not k().requires_target:
-                                        o = k().on_use(selected_unit, None)
-                                        party_inventory.update({ k: v - 1 })
-                                        if o:
-                                            add_text_popup(o[0], selected_unit.x + cam.x, selected_unit.y + cam.y, o[1])
+                                        record(("item", k))
+                                        use_item(selected_unit, k)
                                         selected_action = "none"
-                                        selected_unit.action_points -= 1
                                     else:
                                         getting_target = True
                                 y += h
@@ -790,11 +908,13 @@ def main():
                                     selected_action = ["move", "attack", "items", "wait"][i]
                                     
                                     if selected_action == "attack":
-                                        allowed_attacks = get_grid_of_size(selected_unit, selected_unit.weapon.range if selected_unit.weapon else 1)
+                                        allowed_attacks = attack_range.of(selected_unit)
                                         
                                         SOUNDS["swoosh"].play()
 
                                     if selected_action == "wait":
+                                        record(("wait", None))
+
                                         selected_action = "none"
                                         
                                         selected_unit.action_points  = 0
@@ -806,6 +926,8 @@ def main():
                                 y += h
                         elif selected_action == "none" and not placed:
                             if nature[selected_pos[1] * world_size[0] + selected_pos[0]] == 16:
+                                record(("place", selected_pos))
+
                                 if not len(character_buffer):
                                     friendly_units.append(character_classes[placing_unit](True, selected_pos[0], selected_pos[1], character_names[placing_unit]))
                                 else:
@@ -817,6 +939,7 @@ def main():
                                 placing_unit += 1
 
                                 nature[selected_pos[1] * world_size[0] + selected_pos[0]] = 0
+                                scan_scenery()
 
                                 if placing_unit == len(character_classes):
                                     banner_text = "Player Turn"
@@ -832,6 +955,15 @@ def main():
                                         for x in range(world_size[0]):
                                             nature[y * world_size[0] + x] %= 16
 
+                                    scan_scenery()
+
+                                    solids.set_terrain(nature)
+                                    solids.occupy(units)
+
+                                    player_threat.invalidate()
+                                    enemy_threat.invalidate()
+                                    enemy_flow.invalidate()
+
                     elif event.button == 3:
                         selected_action = "none"
                 else:
@@ -914,10 +1046,9 @@ def main():
                                 w, h = 200, 30
                                 x, y = WIDTH // 3 - w // 2, HEIGHT // 3
 
-                                surf.blit(t := FONT.render("Available Battles", True, 'black'), (x + 1, y + 1))
-                                surf.blit(t := FONT.render("Available Battles", True, 'white'), (x, y))
+                                t = draw_text(surf, FONT, "Available Battles", 'white', x, y, 1)
 
-                                y += t.get_height() + 5
+                                y += t.height + 5
 
                                 for i, (name, filename) in enumerate(available_levels):
                                     if pygame.Rect(x, y, w, h).collidepoint(mx, my):
@@ -997,7 +1128,8 @@ def main():
                                     level_name, level_filename = all_levels[current_level]
 
                                     # schemas are forest, mountain, desert, icy, and chaos
-                                    world_size, schema, nature, enemy_units, thru_dialogue, end_dialogue, available_sidequests, next_level, level_reward = level_from_file(os.path.join("assets", "levels", level_filename))
+                                    world_size, schema, nature, enemy_units, thru_dialogue, end_dialogue, available_sidequests, next_level, level_reward, move_costs = level_from_file(os.path.join("assets", "levels", level_filename))
+                                    scan_scenery()
                                                                         
                                     save_characters()
                                     friendly_units = []
@@ -1010,13 +1142,21 @@ def main():
 
                                     selected_unit = None
 
-                                    c = GenerateSolidsMap(nature, units, world_size[0], world_size[1])
+                                    solids = SolidsMap(nature, world_size, move_costs)
+                                    attack_range = AttackRange(nature, world_size)
+
+                                    battle_seed = new_seed()
+                                    battle_rng = random.Random(battle_seed)
 
-                                    graph = path.SimpleGraph(cost=c, cardinal=1, diagonal=0)
+                                    recorder = start_recording()
 
-                                    c2 = GenerateSolidsMap(nature, enemy_units, world_size[0], world_size[1])
+                                    enemy_solids = SolidsMap(nature, world_size, move_costs)
+                                    enemy_solids.occupy(enemy_units)
 
-                                    graph_enemies_only = path.SimpleGraph(cost=c2, cardinal=1, diagonal=0)
+                                    player_threat.invalidate()
+                                    enemy_threat.invalidate()
+                                    enemy_flow.invalidate()
+                                    ai_worker.cancel()
 
                                     menu = -1
                                     placing_unit = 0
@@ -1040,6 +1180,9 @@ def main():
                                     menu = 1
 
         if battling and placed:
+            if recorder and not (friendly_units and enemy_units):
+                recorder.close()
+
             if len(friendly_units) == 0:
                 battling = False
                 won = False
@@ -1097,53 +1240,55 @@ def main():
                 character_buffer += friendly_units.copy()
 
         if battling:
+            compositor.mark_all()
+
             if placed:
-                c = GenerateSolidsMap(nature, units, world_size[0], world_size[1])
+                if turn & 1 and selected_action == "none" and animation_time <= 0 and not ai_worker.busy and not replay_queue:
+                    allowed_moves = draw_unit_move_grid(selected_unit, cam.x, cam.y, solids, False)
 
-                graph = path.SimpleGraph(cost=c, cardinal=1, diagonal=0)
+                    player_threat.update(friendly_units, solids, reachability)
+                    enemy_flow.update(friendly_units, solids)
 
-                if turn & 1 and selected_action == "none" and animation_time <= 0:
-                    allowed_moves = draw_unit_move_grid(selected_unit, cam.x, cam.y, graph)
-                    
-                    cx, cy = selected_unit.x, selected_unit.y
+                    ai_worker.submit(selected_unit, allowed_moves, friendly_units, player_threat.damage, enemy_flow.dist, attack_range)
 
-                    closest_distance = 0xffff
-                    closest_enemy = None
+                # the frame keeps going while the enemy thinks; its answer is picked up when ready
+                if replay_queue:
+                    # the enemy's recorded decisions stand in for the planner's
+                    plan = replay_queue.pop(0) if turn & 1 and selected_action == "none" and animation_time <= 0 else None
+                else:
+                    plan = turn & 1 and selected_action == "none" and ai_worker.poll()
+
+                if plan:
+                    decision, target_pos = plan
 
-                    for unit in friendly_units:
-                        distance = abs(unit.x - selected_unit.x) + abs(unit.y - selected_unit.y)
+                    if decision != "move":
+                        record(plan)
 
-                        if distance < closest_distance:
-                            closest_distance = distance
-                            closest_enemy = unit
+                    if decision == "attack":
+                        allowed_attacks = attack_range.of(selected_unit)
 
-                    if abs(closest_enemy.x - selected_unit.x) + abs(closest_enemy.y - selected_unit.y) <= 1:    
-                        allowed_attacks = get_grid_of_size(selected_unit, selected_unit.weapon.range if selected_unit.weapon else 1)
+                        target = next((u for u in friendly_units if (u.x, u.y) == target_pos), None)
 
-                        if (closest_enemy.x, closest_enemy.y) in allowed_attacks:
-                            unit = closest_enemy
+                        if target and target_pos in allowed_attacks:
+                            unit = target
                             if unit.health > 0:
-                                if random.random() <= selected_unit.calculate_hit_chance():
-                                    if random.random() <= unit.calculate_protection_chance():
+                                outcome, d = resolve_attack(selected_unit, unit, battle_rng)
+                                if outcome != "missed":
+                                    if outcome == "protected":
                                         add_text_popup(f"Protected!", unit.x + cam.x, unit.y + cam.y, "forestgreen")
                                     else:
-                                        if selected_unit.weapon:
-                                            d = selected_unit.weapon.damage
-                                            if selected_unit.weapon.damage_type == DamageType.FIRE and random.random() <= 0.5:
-                                                unit.onfire = True
-                                        else:
-                                            d = 0
-                                        d += random.randint(0, selected_unit.strength)
-                                        if unit.armor: d = max(0, d - random.randint(0, unit.armor.protection_value))
                                         add_text_popup(f"-{d}", unit.x + cam.x, unit.y + cam.y, "brown1")
-                                        unit.health -= d
                                     if unit.health <= 0:
                                         if unit in friendly_units:
                                             character_buffer.append(unit)
                                             friendly_units.remove(unit)
+                                            enemy_flow.invalidate()
+                                            player_threat.invalidate()
                                         else:
                                             enemy_units.remove(unit)
+                                            enemy_threat.invalidate()
                                         units.remove(unit)
+                                        solids.remove(unit.x, unit.y)
                                         SOUNDS["smash"].play()
                                     else:
                                         play_tap_sound()
@@ -1161,21 +1306,17 @@ def main():
                             animation_time = 0.5
                         
                         selected_unit.action_points -= 1
-                    else:
-                        selected_action = "move"
+                    elif decision == "wait":
+                        selected_unit.action_points = 0
 
-                        closest_distance = 0xffff
-                        closest_tile = None
+                        SOUNDS["unknown"].play()
 
-                        for tile in allowed_moves:
-                            distance = abs(tile[0] - closest_enemy.x) + abs(tile[1] - closest_enemy.y)
-
-                            if distance < closest_distance:
-                                closest_distance = distance
-                                closest_tile = tile
+                        animation_time = 0.5
+                    else:
+                        selected_action = "move"
 
-                        if closest_tile:
-                            cx, cy = closest_tile
+                        if target_pos:
+                            cx, cy = target_pos
 
                             unit_path_to(selected_unit, cx, cy, False)
                             
@@ -1186,8 +1327,13 @@ def main():
                         every_unit_in_place = True
                         
                         for unit in units:
+                            ox, oy = unit.x, unit.y
+
                             if unit.update(delta):
                                 SOUNDS["thud"].play()
+
+                            if (unit.x, unit.y) != (ox, oy):
+                                solids.move(ox, oy, unit.x, unit.y)
                                 
                             if len(unit.path) > 0 or unit.draw_x != unit.x or unit.draw_y != unit.y:
                                 every_unit_in_place = False
@@ -1199,6 +1345,9 @@ def main():
                                 unit.draw_x = unit.x
                                 unit.draw_y = unit.y
 
+                            # where it actually ended up, so the log never depends on how the path went
+                            record(("move", (selected_unit.x, selected_unit.y)))
+
                             selected_unit.action_points -= 1
                             selected_action = "none"
 
@@ -1206,7 +1355,10 @@ def main():
                     elif not turn & 1:
                         for unit in units:
                             if unit == selected_unit:
-                                if selected_pos in allowed_moves:
+                                # only re-extract the preview when the hovered tile or the board changed,
+                                # or when something cleared it, e.g. another unit took its turn at moving
+                                if selected_pos in allowed_moves and (hover_key != (unit, selected_pos, solids.revision) or not unit.path):
+                                    hover_key = (unit, selected_pos, solids.revision)
                                     unit_path_to(unit, selected_pos[0], selected_pos[1])
                             else:
                                 unit.path = []
@@ -1222,6 +1374,14 @@ def main():
 
                         turn += 1
 
+                        # a crash loses at most the turn in progress
+                        if recorder:
+                            recorder.flush()
+
+                        player_threat.invalidate()
+                        enemy_threat.invalidate()
+                        enemy_flow.invalidate()
+
                         if turn < len(thru_dialogue):
                             for i in range(len(thru_dialogue[turn])):
                                 dialogue_manager.queue_text(thru_dialogue[turn][i])
@@ -1233,24 +1393,26 @@ def main():
                             next_unit = enemy_units[idx]
 
                             if next_unit.onfire:
-                                q = random.randint(0, 10)
-                                next_unit.health = max(0, next_unit.health - q)
+                                q = burn(next_unit, battle_rng)
                                 add_text_popup(f"-{q}", next_unit.x + cam.x, next_unit.y + cam.y, 'brown1')
 
                                 if next_unit.health <= 0:
                                     if turn & 1:
                                         enemy_units.remove(next_unit)
+                                        enemy_threat.invalidate()
                                     else:
                                         friendly_units.remove(next_unit)
+                                        enemy_flow.invalidate()
+                                        player_threat.invalidate()
                                     units.remove(next_unit)
-                                else:
-                                    if random.random() <= 0.5:
-                                        next_unit.onfire = False
+                                    solids.remove(next_unit.x, next_unit.y)
 
                             current_unit = 0
                             selected_unit = enemy_units[current_unit]
                             selected_action = "none"
 
+                            planner.start_turn()
+
                             banner_text = "Enemy Turn"
                             banner_time = 3.0
                         else:
@@ -1261,19 +1423,19 @@ def main():
                             next_unit = friendly_units[idx]
 
                             if next_unit.onfire:
-                                q = random.randint(0, 10)
-                                next_unit.health = max(0, next_unit.health - q)
+                                q = burn(next_unit, battle_rng)
                                 add_text_popup(f"-{q}", next_unit.x + cam.x, next_unit.y + cam.y, 'brown1')
 
                                 if next_unit.health <= 0:
                                     if turn & 1:
                                         enemy_units.remove(next_unit)
+                                        enemy_threat.invalidate()
                                     else:
                                         friendly_units.remove(next_unit)
+                                        enemy_flow.invalidate()
+                                        player_threat.invalidate()
                                     units.remove(next_unit)
-                                else:
-                                    if random.random() <= 0.5:
-                                        next_unit.onfire = False
+                                    solids.remove(next_unit.x, next_unit.y)
 
                             current_unit = 0
                             selected_unit = friendly_units[current_unit]
@@ -1290,19 +1452,19 @@ def main():
                         next_unit = enemy_units[idx] if turn & 1 else friendly_units[idx]
 
                         if next_unit.onfire:
-                            q = random.randint(0, 10)
-                            next_unit.health = max(0, next_unit.health - q)
+                            q = burn(next_unit, battle_rng)
                             add_text_popup(f"-{q}", next_unit.x + cam.x, next_unit.y + cam.y, 'brown1')
 
                             if next_unit.health <= 0:
                                 if turn & 1:
                                     enemy_units.remove(next_unit)
+                                    enemy_threat.invalidate()
                                 else:
                                     friendly_units.remove(next_unit)
+                                    enemy_flow.invalidate()
+                                    player_threat.invalidate()
                                 units.remove(next_unit)
-                            else:
-                                if random.random() <= 0.5:
-                                    next_unit.onfire = False
+                                solids.remove(next_unit.x, next_unit.y)
 
                         current_unit += 1
                         if turn & 1:
@@ -1325,16 +1487,7 @@ def main():
 
             screen.blit(BG, (0, 0))
 
-            t = pygame.time.get_ticks() / 100
-            t %= 50
-
-            for x in range(WIDTH // 50 + 1):
-                for y in range(HEIGHT // 50 + 1):
-                    if (x + y) % 2 == 0:
-                        fx, fy = 25 + x * 50 - t, 25 + y * 50 - t
-                        q = 1 - abs(2 * (((fx + fy) / (WIDTH + HEIGHT) - 0.5)))
-                        r = 25 * pow(q, 1)
-                        pygame.draw.circle(screen, darken(pygame.Color('darkslategray2').lerp('darkslategray4', clamp(fy / HEIGHT, 0, 1)), 0.1), (fx, fy), r)
+            DOTS.draw(screen, pygame.time.get_ticks() / 100)
 
             match schema:
                 case "forest":
@@ -1352,49 +1505,55 @@ def main():
             
             colors.append(darken(colors[0], 0.1))
 
-            for x in range(world_size[0]):
-                for y in range(world_size[1]):
-                    if nature[y * world_size[0] + x] in [3, 4]: # water or bridge
-                        oy = - 0.25 + math.sin((x + y) + pygame.time.get_ticks() / 200) * 0.05
-                        color = "deepskyblue" if (x + y) % 2 == 0 else darken("deepskyblue", 0.1)
-                        draw_tile(x + cam.x - oy, y + cam.y - oy, color)
-                        if OUTLINE: draw_tile(x + cam.x - oy, y + cam.y - oy, darken(color, 0.3), True)
-
-                        if nature[y * world_size[0] + x] == 4:
-                            bridge_color = "chocolate4" if (x + y) % 2 == 0 else darken("chocolate4", 0.1)
-                            draw_tile_flat(x + cam.x, y + cam.y, bridge_color)
-                            if OUTLINE: draw_tile_flat(x + cam.x, y + cam.y, darken(bridge_color, 0.3), True)
-                        continue
+            # water bobs, so it's drawn live underneath the baked ground tiles
+            for x, y in water_tiles:
+                oy = - 0.25 + math.sin((x + y) + pygame.time.get_ticks() / 200) * 0.05
+                color = "deepskyblue" if (x + y) % 2 == 0 else darken("deepskyblue", 0.1)
+                draw_tile(x + cam.x - oy, y + cam.y - oy, color)
+                if OUTLINE: draw_tile(x + cam.x - oy, y + cam.y - oy, darken(color, 0.3), True)
+
+            terrain_layer.draw(screen, (cam.x, cam.y, schema), bake_terrain)
 
-                    color = colors[0] if (x + y) % 2 == 0 else colors[1]
-                    draw_tile(x + cam.x, y + cam.y, color)
-                    if OUTLINE: draw_tile(x + cam.x, y + cam.y, darken(color, 0.3), True)
+            for x, y in water_tiles:
+                if nature[y * world_size[0] + x] == 4:
+                    bridge_color = "chocolate4" if (x + y) % 2 == 0 else darken("chocolate4", 0.1)
+                    draw_tile_flat(x + cam.x, y + cam.y, bridge_color)
+                    if OUTLINE: draw_tile_flat(x + cam.x, y + cam.y, darken(bridge_color, 0.3), True)
 
             match selected_action:
                 case "move":
                     if not units_should_move:
-                        allowed_moves = draw_unit_move_grid(selected_unit, cam.x, cam.y, graph)
+                        allowed_moves = draw_unit_move_grid(selected_unit, cam.x, cam.y, solids)
                 case "attack":
                     for t in allowed_attacks:
                         draw_small_tile(t[0] + cam.x, t[1] + cam.y, "brown1")
 
-            for x in range(world_size[0]):
-                for y in range(world_size[1]):
-                    if nature[y * world_size[0] + x] == 1:
-                        draw_tree(x + cam.x, y + cam.y)
-                    if nature[y * world_size[0] + x] == 2:
-                        draw_rock(x + cam.x, y + cam.y)
-                    if nature[y * world_size[0] + x] == 16:
-                        draw_small_tile(x + cam.x, y + cam.y, 'yellow')
-                        
-                    for u in friendly_units + enemy_units:
-                        if int(u.x) == x and int(u.y) == y:
-                            draw_unit(u, u in friendly_units, cam.x, cam.y, u == selected_unit, selected_action == "move")
-                            if u.weapon:
-                                fx, fy = from_world_pos(u.draw_x + cam.x, u.draw_y + cam.y)
-                                u.weapon.draw(screen, delta, fx, fy, u.character.scale)
-
-            battle_ss = screen.copy()
+            if show_danger and placed:
+                enemy_threat.update(enemy_units, solids, reachability)
+                danger_layer.draw(screen, (cam.x, cam.y, enemy_threat.revision), bake_danger)
+
+            # merge the units, sorted by tile, into the pre-sorted scenery so both draw in painter's order
+            draw_order = sorted(friendly_units + enemy_units, key=lambda u: (int(u.x), int(u.y)))
+            friendly = set(friendly_units)
+
+            k = 0
+            for x, y, n in scenery_tiles + [(world_size[0], 0, None)]:
+                while k < len(draw_order) and (int(draw_order[k].x), int(draw_order[k].y)) < (x, y):
+                    u = draw_order[k]
+                    draw_unit(u, u in friendly, cam.x, cam.y, u == selected_unit, selected_action == "move")
+                    if u.weapon:
+                        fx, fy = from_world_pos(u.draw_x + cam.x, u.draw_y + cam.y)
+                        u.weapon.draw(screen, delta, fx, fy, u.character.scale)
+                    k += 1
+
+                if n == 1:
+                    draw_tree(x + cam.x, y + cam.y)
+                if n == 2:
+                    draw_rock(x + cam.x, y + cam.y)
+                if n == 16:
+                    draw_small_tile(x + cam.x, y + cam.y, 'yellow')
+
+            battle_ss.blit(screen, (0, 0))
 
             for popup in popups:
                 popup["time"] -= delta
@@ -1402,18 +1561,14 @@ def main():
                 if popup["time"] <= 0:
                     popups.remove(popup)
                 else:
-                    small = SMALL_FONT.render(popup["text"], True, 'black')
-                    small.set_alpha(int(255 * popup["time"]))
-                    screen.blit(small, (popup["x"] + 1, popup["y"] + 1))
-                    small = SMALL_FONT.render(popup["text"], True, popup["color"])
-                    small.set_alpha(int(255 * popup["time"]))
-                    screen.blit(small, (popup["x"], popup["y"]))
+                    popup["surf"].set_alpha(int(255 * popup["time"]))
+                    screen.blit(popup["surf"], (popup["x"], popup["y"]))
 
             can_show_info = True
 
             if selected_action == "none" and not turn & 1:
                 if selected_unit and selected_unit.placed:
-                    screen.blit(t := FONT.render("Select an Action", True, 'black'), (WIDTH // 2 - t.get_width() // 2, 10))
+                    screen.blit(t := TEXT_CACHE.render(FONT, "Select an Action", 'black'), (WIDTH // 2 - t.get_width() // 2, 10))
                     s = 50
                     w, h = 80, 30
                     x, y = from_world_pos(selected_unit.x + cam.x, selected_unit.y + cam.y)
@@ -1437,16 +1592,14 @@ def main():
                             info_string = f"{unit.name}"
                             if unit in friendly_units: info_string += f" ({unit.health}/{unit.max_health} HP)"
 
-                            screen.blit(t := FONT.render(info_string, True, 'black'), (1 + mx + 150 - t.get_width() / 2, 1 + my + 5))
-                            screen.blit(t := FONT.render(info_string, True, 'white'), (mx + 150 - t.get_width() / 2, my + 5))
+                            t = draw_text(screen, FONT, info_string, 'white', mx + 150, my + 5, 1, (0.5, 0))
                         
                             for i, line in enumerate(unit.description + ["", "Equipped with:", f"{unit.armor.name if unit.armor else 'no armor'}, {unit.weapon.name if unit.weapon else 'no weapon'}"]):
-                                screen.blit(t := SMALL_FONT.render(line, True, 'black'), (1 + mx + 5, 1 + my + 45 + i * SMALL_FONT.size(line)[1]))
-                                screen.blit(t := SMALL_FONT.render(line, True, 'white'), (mx + 5, my + 45 + i * SMALL_FONT.size(line)[1]))
+                                t = draw_text(screen, SMALL_FONT, line, 'white', mx + 5, my + 45 + i * SMALL_FONT.size(line)[1], 1)
 
                             break
             elif selected_action == "items" and not turn & 1:
-                screen.blit(t := FONT.render("Select an Item", True, 'black'), (WIDTH // 2 - t.get_width() // 2, 10))
+                screen.blit(t := TEXT_CACHE.render(FONT, "Select an Item", 'black'), (WIDTH // 2 - t.get_width() // 2, 10))
                 s = 50
                 w, h = 100, 30
                 x, y = from_world_pos(selected_unit.x + cam.x, selected_unit.y + cam.y)
@@ -1464,9 +1617,9 @@ def main():
                 pygame.draw.rect(screen, 'darkgray', (WIDTH // 2 - (WIDTH - 100) // 2, HEIGHT - 50, WIDTH - 100, 20), 0, 8)
                 pygame.draw.rect(screen, 'orange', (WIDTH // 2 - ap_w // 2, HEIGHT - 50, ap_w, 20), 0, 8)
 
-                screen.blit(t := SMALL_FONT.render(f"AP: {selected_unit.action_points} / {selected_unit.max_action_points}", True, 'black'), (50, HEIGHT - 25))
+                screen.blit(t := TEXT_CACHE.render(SMALL_FONT, f"AP: {selected_unit.action_points} / {selected_unit.max_action_points}", 'black'), (50, HEIGHT - 25))
 
-            screen.blit(t := SMALL_FONT.render(f"Turn {1 + turn // 2}", True, 'black'), (WIDTH - t.get_width() - 5, 5))
+            screen.blit(t := TEXT_CACHE.render(SMALL_FONT, f"Turn {1 + turn // 2}", 'black'), (WIDTH - t.get_width() - 5, 5))
 
             x, y = 0, 20
             w = 185
@@ -1478,14 +1631,15 @@ def main():
                 if not unit.placed:
                     continue
 
-                surf = pygame.Surface((w, h), pygame.SRCALPHA)
+                surf = SURFACES.get("unit_panel", (w, h), pygame.SRCALPHA)
+                surf.fill((0, 0, 0, 0))
                 pygame.draw.polygon(surf, (0, 0, 0, 128), [
                     (0, 0), (0 + w - t, 0),
                     (0 + w, 0 + h), (0, 0 + h)
                 ])
 
-                surf.blit(FONT.render(unit.name, True, 'white'), (5, 3))
-                surf.blit(SMALL_FONT.render(f"{unit.health} / {unit.max_health} HP - LVL {unit.level}", True, 'white'), (5, 30))
+                surf.blit(TEXT_CACHE.render(FONT, unit.name, 'white'), (5, 3))
+                surf.blit(TEXT_CACHE.render(SMALL_FONT, f"{unit.health} / {unit.max_health} HP - LVL {unit.level}", 'white'), (5, 30))
 
                 screen.blit(surf, (x, y))
 
@@ -1503,13 +1657,13 @@ def main():
                 y += h + s
 
             if not placed:
-                screen.blit(t := FONT.render(f"Place {character_names[placing_unit]}", True, 'black'), (WIDTH // 2 - t.get_width() // 2, 10))
+                screen.blit(t := TEXT_CACHE.render(FONT, f"Place {character_names[placing_unit]}", 'black'), (WIDTH // 2 - t.get_width() // 2, 10))
 
             # draw banner
             if banner_time > 0 and banner_text:
                 banner_time -= delta
                 bt = banner_time / 3.0
-                s = pygame.Surface((WIDTH, 100), pygame.SRCALPHA)
+                s = SURFACES.get("banner", (WIDTH, 100), pygame.SRCALPHA)
 
                 s.fill((0, 0, 0, 128))
                 for i in range(WIDTH // 20):
@@ -1517,7 +1671,7 @@ def main():
                         if (i + j) % 2 == 0:
                             pygame.draw.rect(s, (64, 64, 64, 128), (i * 20, j * 20, 20, 20), 0)
                 pygame.draw.rect(s, (255, 255, 255, 255), (0, 0, WIDTH, 100), 1)
-                s.blit(t := BIG_FONT.render(banner_text, True, 'white'), (WIDTH // 2 - t.get_width() // 2, 50 - t.get_height() // 2))
+                s.blit(t := TEXT_CACHE.render(BIG_FONT, banner_text, 'white'), (WIDTH // 2 - t.get_width() // 2, 50 - t.get_height() // 2))
 
                 s.set_alpha(int(255 * bt))
 
@@ -1527,28 +1681,32 @@ def main():
         else:
             curtain_timer = max(0, curtain_timer - delta)
 
+            # once the curtain is down only hovers, clicks and dialogue change the screen,
+            # so the dots hold still and just the changed regions get pushed
+            idle = DIRTY_RECTS and curtain_timer == 0
+
+            if not idle:
+                compositor.mark_all()
+                dots_t = pygame.time.get_ticks() / 100
+            elif not evs and not dialogue_manager.has_dialogue() and not SHOW_STATS:
+                continue
+
+            for event in evs:
+                if event.type != pygame.MOUSEMOTION:
+                    compositor.mark_all()
+
             # non-battle drawing code
             screen.blit(battle_ss, (0, 0))
             
-            surf = pygame.Surface((WIDTH, HEIGHT))
+            surf = SURFACES.get("menu", (WIDTH, HEIGHT))
             
             surf.fill(colors[0])
 
-            t = pygame.time.get_ticks() / 100
-            t %= 50
-
-            for x in range(WIDTH // 50 + 1):
-                for y in range(HEIGHT // 50 + 1):
-                    if (x + y) % 2 == 0:
-                        fx, fy = 25 + x * 50 - t, 25 + y * 50 - t
-                        q = 1 - abs(2 * (((fx + fy) / (WIDTH + HEIGHT) - 0.5)))
-                        r = 25 * pow(q, 1)
-                        pygame.draw.circle(surf, colors[1], (fx, fy), r)
+            DOTS.draw(surf, dots_t)
 
             match menu:
                 case -1:
-                    surf.blit(t := BIG_FONT.render(f"Battle {'Won' if won else 'Lost'}!", True, "black"), (2 + WIDTH // 2 - t.get_width() // 2, 27))
-                    surf.blit(t := BIG_FONT.render(f"Battle {'Won' if won else 'Lost'}!", True, "white"), (WIDTH // 2 - t.get_width() // 2, 25))
+                    t = draw_text(surf, BIG_FONT, f"Battle {'Won' if won else 'Lost'}!", 'white', WIDTH // 2, 25, 2, (0.5, 0))
 
                     w, h = 90, 30
 
@@ -1556,31 +1714,31 @@ def main():
                     for i in range(len(words)):
                         draw_button(surf, WIDTH // 2 - w // 2, HEIGHT * 0.85 - h // 2 + (h + 10) * i, w, h, words[i])
             
-                    subsurf = pygame.Surface((WIDTH // 2, HEIGHT // 2), pygame.SRCALPHA)
+                    subsurf = SURFACES.get("messages", (WIDTH // 2, HEIGHT // 2), pygame.SRCALPHA)
+                    subsurf.fill((0, 0, 0, 0))
 
                     pygame.draw.rect(subsurf, (0, 0, 0, 128), (0, 0, WIDTH // 2, HEIGHT // 3), 0, 8)
 
                     ly = 5
                     for line in messages:
-                        subsurf.blit(t := FONT.render(line, True, 'white'), (5, ly))
+                        subsurf.blit(t := TEXT_CACHE.render(FONT, line, 'white'), (5, ly))
                         ly += t.get_height()
 
                     surf.blit(subsurf, (WIDTH // 4, HEIGHT // 2 - HEIGHT // 6))
                 case 0: # shop
-                    surf.blit(t := BIG_FONT.render("Shop", True, 'black'), (WIDTH // 2 - t.get_width() // 2 + 2, 7))
-                    surf.blit(t := BIG_FONT.render("Shop", True, 'white'), (WIDTH // 2 - t.get_width() // 2, 5))
+                    t = draw_text(surf, BIG_FONT, "Shop", 'white', WIDTH // 2, 5, 2, (0.5, 0))
                     
                     w, h = 200, 30
                     x, y = WIDTH // 3 - w // 2, HEIGHT // 3
 
-                    surf.blit(t := FONT.render("Shop Items", True, 'black'), (x + 1, y + 1))
-                    surf.blit(t := FONT.render("Shop Items", True, 'white'), (x, y))
+                    t = draw_text(surf, FONT, "Shop Items", 'white', x, y, 1)
 
-                    y += t.get_height() + 5
+                    y += t.height + 5
 
                     for i, (k, v) in enumerate(shop_inventory.items()):
                         t = f"{v}x {k().name} - {k().price}b"
-                        option_surf = pygame.Surface((w, h), pygame.SRCALPHA)
+                        option_surf = SURFACES.get("option", (w, h), pygame.SRCALPHA)
+                        option_surf.fill((0, 0, 0, 0))
 
                         color = (0, 0, 0, 192) if pygame.Rect(x, y, w, h).collidepoint(pygame.mouse.get_pos()) else (0, 0, 0, 128)
 
@@ -1595,20 +1753,21 @@ def main():
                                 pygame.draw.rect(option_surf, color, (0, 0, w, h))
 
                         surf.blit(option_surf, (x, y))
-                        surf.blit(text := SMALL_FONT.render(t, True, 'white'), (x + 5, y + h // 2 - text.get_height() // 2))
+                        compositor.track(("option", x, y), (x, y, w, h), (color, t))
+                        surf.blit(text := TEXT_CACHE.render(SMALL_FONT, t, 'white'), (x + 5, y + h // 2 - text.get_height() // 2))
 
                         y += h
 
                     x, y = WIDTH * (2 / 3) - w // 2, HEIGHT // 3
 
-                    surf.blit(t := FONT.render("Your Items", True, 'black'), (x + 1, y + 1))
-                    surf.blit(t := FONT.render("Your Items", True, 'white'), (x, y))
+                    t = draw_text(surf, FONT, "Your Items", 'white', x, y, 1)
 
-                    y += t.get_height() + 5
+                    y += t.height + 5
 
                     for i, (k, v) in enumerate(party_inventory.items()):
                         t = f"{v}x {k().name} - {int(k().price * (1 - sell_falloff))}b"
-                        option_surf = pygame.Surface((w, h), pygame.SRCALPHA)
+                        option_surf = SURFACES.get("option", (w, h), pygame.SRCALPHA)
+                        option_surf.fill((0, 0, 0, 0))
 
                         color = (0, 0, 0, 192) if pygame.Rect(x, y, w, h).collidepoint(pygame.mouse.get_pos()) else (0, 0, 0, 128)
 
@@ -1623,32 +1782,32 @@ def main():
                                 pygame.draw.rect(option_surf, color, (0, 0, w, h))
 
                         surf.blit(option_surf, (x, y))
-                        surf.blit(text := SMALL_FONT.render(t, True, 'white'), (x + 5, y + h // 2 - text.get_height() // 2))
+                        compositor.track(("option", x, y), (x, y, w, h), (color, t))
+                        surf.blit(text := TEXT_CACHE.render(SMALL_FONT, t, 'white'), (x + 5, y + h // 2 - text.get_height() // 2))
 
                         y += h
 
-                    surf.blit(t := FONT.render(f"{buttons}b", True, 'black'), (1 + WIDTH // 2 - t.get_width() // 2, 1 + HEIGHT // 3))
-                    surf.blit(t := FONT.render(f"{buttons}b", True, 'white'), (WIDTH // 2 - t.get_width() // 2, HEIGHT // 3))
+                    t = draw_text(surf, FONT, f"{buttons}b", 'white', WIDTH // 2, HEIGHT // 3, 1, (0.5, 0))
 
-                    dialogue_manager.draw(surf)
+                    if (r := dialogue_manager.draw(surf)):
+                        compositor.mark(r)
 
                     w, h = 100, 30
                     draw_button(surf, WIDTH - w - 10, HEIGHT - h - 10, w, h, "To Tavern")
                 case 1: # tavern
-                    surf.blit(t := BIG_FONT.render("Tavern", True, 'black'), (WIDTH // 2 - t.get_width() // 2 + 2, 7))
-                    surf.blit(t := BIG_FONT.render("Tavern", True, 'white'), (WIDTH // 2 - t.get_width() // 2, 5))
+                    t = draw_text(surf, BIG_FONT, "Tavern", 'white', WIDTH // 2, 5, 2, (0.5, 0))
                     
                     w, h = 200, 30
                     x, y = WIDTH // 3 - w // 2, HEIGHT // 3
 
-                    surf.blit(t := FONT.render("Available Battles", True, 'black'), (x + 1, y + 1))
-                    surf.blit(t := FONT.render("Available Battles", True, 'white'), (x, y))
+                    t = draw_text(surf, FONT, "Available Battles", 'white', x, y, 1)
 
-                    y += t.get_height() + 5
+                    y += t.height + 5
 
                     for i, (name, filename) in enumerate(available_levels):
                         t = name
-                        option_surf = pygame.Surface((w, h), pygame.SRCALPHA)
+                        option_surf = SURFACES.get("option", (w, h), pygame.SRCALPHA)
+                        option_surf.fill((0, 0, 0, 0))
 
                         if name == all_levels[current_level][0]:
                             color = (255, 192, 0, 192) if pygame.Rect(x, y, w, h).collidepoint(pygame.mouse.get_pos()) else (255, 192, 0, 128)
@@ -1666,67 +1825,67 @@ def main():
                                 pygame.draw.rect(option_surf, color, (0, 0, w, h))
 
                         surf.blit(option_surf, (x, y))
-                        surf.blit(text := SMALL_FONT.render(t, True, 'white'), (x + 5, y + h // 2 - text.get_height() // 2))
+                        compositor.track(("option", x, y), (x, y, w, h), (color, t))
+                        surf.blit(text := TEXT_CACHE.render(SMALL_FONT, t, 'white'), (x + 5, y + h // 2 - text.get_height() // 2))
 
                         y += h
 
                     x, y = WIDTH * (2 / 3) - w // 2, HEIGHT // 3
 
-                    surf.blit(t := FONT.render("Selected Battle", True, 'black'), (x + 1, y + 1))
-                    surf.blit(t := FONT.render("Selected Battle", True, 'white'), (x, y))
+                    t = draw_text(surf, FONT, "Selected Battle", 'white', x, y, 1)
 
                     w *= 1.5
                     h *= 10
 
-                    y += t.get_height() + 5
+                    y += t.height + 5
 
                     l = all_levels[current_level]
 
                     t = f"{l[0]}"
-                    option_surf = pygame.Surface((w, h), pygame.SRCALPHA)
+                    option_surf = SURFACES.get("option", (w, h), pygame.SRCALPHA)
+                    option_surf.fill((0, 0, 0, 0))
 
                     color = (0, 0, 0, 192)
 
                     pygame.draw.rect(option_surf, color, (0, 0, w, h), 0, 8)
 
                     surf.blit(option_surf, (x, y))
-                    surf.blit(text := FONT.render(t, True, 'white'), (x + 5, y + 5))
+                    surf.blit(text := TEXT_CACHE.render(FONT, t, 'white'), (x + 5, y + 5))
 
                     y += 5 + text.get_height()
 
-                    surf.blit(text := SMALL_FONT.render(level_descriptions[current_level], True, 'white'), (x + 5, y))
+                    surf.blit(text := TEXT_CACHE.render(SMALL_FONT, level_descriptions[current_level], 'white'), (x + 5, y))
                     y += text.get_height() + SMALL_FONT.size(' ')[1]
 
                     for index, challenge in enumerate(level_challenges[current_level]):
-                        surf.blit(text := FONT.render(challenge, True, 'white'), (x + 5, y))
+                        surf.blit(text := TEXT_CACHE.render(FONT, challenge, 'white'), (x + 5, y))
                         y += text.get_height()
                         draw_star(surf, x + w - 20, y - 20, 15, col='yellow' if completed_challenges[current_level][index] else 'gray')
 
-                    dialogue_manager.draw(surf)
+                    if (r := dialogue_manager.draw(surf)):
+                        compositor.mark(r)
 
                     w, h = 100, 30
                     draw_button(surf, WIDTH - w - 10, HEIGHT - h - 10, w, h, "To Toybox")
                     draw_button(surf, 10, HEIGHT - h - 10, w, h, "To Shop")
                 case 2: # toybox
-                    surf.blit(t := BIG_FONT.render("Toybox", True, 'black'), (WIDTH // 2 - t.get_width() // 2 + 2, 7))
-                    surf.blit(t := BIG_FONT.render("Toybox", True, 'white'), (WIDTH // 2 - t.get_width() // 2, 5))
+                    t = draw_text(surf, BIG_FONT, "Toybox", 'white', WIDTH // 2, 5, 2, (0.5, 0))
                     
-                    surf.blit(t := FONT.render(f"Selected Battle: {all_levels[current_level][0]}", True, 'black'), (WIDTH // 2 - t.get_width() // 2 + 1, HEIGHT - t.get_height() - 5 + 1))
-                    surf.blit(t := FONT.render(f"Selected Battle: {all_levels[current_level][0]}", True, 'white'), (WIDTH // 2 - t.get_width() // 2, HEIGHT - t.get_height() - 5))
+                    t = draw_text(surf, FONT, f"Selected Battle: {all_levels[current_level][0]}", 'white', WIDTH // 2, HEIGHT - 5, 1, (0.5, 1))
 
                     w, h = 160, 30
                     x, y = WIDTH // 4 - w // 2, HEIGHT // 3
 
-                    surf.blit(t := FONT.render("Your Items", True, 'black'), (x + 1, y + 1))
-                    surf.blit(t := FONT.render("Your Items", True, 'white'), (x, y))
+                    t = draw_text(surf, FONT, "Your Items", 'white', x, y, 1)
 
-                    y += t.get_height() + 5
+                    y += t.height + 5
 
                     items = list(filter(lambda x: not issubclass(x[0], Item), party_inventory.items()))
 
                     for i, (k, v) in enumerate(items):
                         t = f"{v}x {k().name}"
-                        option_surf = pygame.Surface((w, h), pygame.SRCALPHA)
+                        option_surf = SURFACES.get("option", (w, h), pygame.SRCALPHA)
+                        option_surf.fill((0, 0, 0, 0))
 
                         color = (0, 0, 0, 192) if pygame.Rect(x, y, w, h).collidepoint(pygame.mouse.get_pos()) else (0, 0, 0, 128)
 
@@ -1741,21 +1900,22 @@ def main():
                                 pygame.draw.rect(option_surf, color, (0, 0, w, h))
 
                         surf.blit(option_surf, (x, y))
-                        surf.blit(text := SMALL_FONT.render(t, True, 'white'), (x + 5, y + h // 2 - text.get_height() // 2))
+                        compositor.track(("option", x, y), (x, y, w, h), (color, t))
+                        surf.blit(text := TEXT_CACHE.render(SMALL_FONT, t, 'white'), (x + 5, y + h // 2 - text.get_height() // 2))
 
                         y += h
 
                     w, h = 100, 30
                     x, y = WIDTH * (1 / 2) - w // 2, HEIGHT // 3
 
-                    surf.blit(t := FONT.render("Units", True, 'black'), (x + 1, y + 1))
-                    surf.blit(t := FONT.render("Units", True, 'white'), (x, y))
+                    t = draw_text(surf, FONT, "Units", 'white', x, y, 1)
 
-                    y += t.get_height() + 5
+                    y += t.height + 5
 
                     for i, unit in enumerate(character_buffer):
                         t = unit.name
-                        option_surf = pygame.Surface((w, h), pygame.SRCALPHA)
+                        option_surf = SURFACES.get("option", (w, h), pygame.SRCALPHA)
+                        option_surf.fill((0, 0, 0, 0))
 
                         if i == giving_unit:
                             color = (255, 192, 0, 192) if pygame.Rect(x, y, w, h).collidepoint(pygame.mouse.get_pos()) else (255, 192, 0, 128)
@@ -1773,7 +1933,8 @@ def main():
                                 pygame.draw.rect(option_surf, color, (0, 0, w, h))
 
                         surf.blit(option_surf, (x, y))
-                        surf.blit(text := SMALL_FONT.render(t, True, 'white'), (x + 5, y + h // 2 - text.get_height() // 2))
+                        compositor.track(("option", x, y), (x, y, w, h), (color, t))
+                        surf.blit(text := TEXT_CACHE.render(SMALL_FONT, t, 'white'), (x + 5, y + h // 2 - text.get_height() // 2))
 
                         y += h
 
@@ -1782,24 +1943,24 @@ def main():
 
                     x, y = WIDTH * 0.75 - w // 2, HEIGHT // 3
 
-                    surf.blit(t := FONT.render("Selected Unit", True, 'black'), (x + 1, y + 1))
-                    surf.blit(t := FONT.render("Selected Unit", True, 'white'), (x, y))
+                    t = draw_text(surf, FONT, "Selected Unit", 'white', x, y, 1)
 
-                    y += t.get_height() + 5
+                    y += t.height + 5
 
                     unit = character_buffer[giving_unit]
 
                     t = f"{unit.name} (LVL {unit.level})"
-                    option_surf = pygame.Surface((w, h), pygame.SRCALPHA)
+                    option_surf = SURFACES.get("option", (w, h), pygame.SRCALPHA)
+                    option_surf.fill((0, 0, 0, 0))
 
                     color = (0, 0, 0, 192)
 
                     pygame.draw.rect(option_surf, color, (0, 0, w, h), 0, 8)
 
                     surf.blit(option_surf, (x, y))
-                    surf.blit(text := FONT.render(t, True, 'white'), (x + 5, y + 5))
+                    surf.blit(text := TEXT_CACHE.render(FONT, t, 'white'), (x + 5, y + 5))
                     y += text.get_height()
-                    surf.blit(text := SMALL_FONT.render("\n".join([
+                    surf.blit(text := TEXT_CACHE.render(SMALL_FONT, "\n".join([
                         f"Max HP:   {unit.max_health}",
                         f"Strength: {unit.strength}",
                         f"Defense:  {unit.defense}",
@@ -1808,9 +1969,10 @@ def main():
                         f"Armor:  {'none' if not unit.armor else unit.armor.name}",
                         f"Weapon: {'none' if not unit.weapon else unit.weapon.name}"
                     ]),
-                    True, 'white'), (x + 5, y + 5))
+                    'white'), (x + 5, y + 5))
 
-                    dialogue_manager.draw(surf)
+                    if (r := dialogue_manager.draw(surf)):
+                        compositor.mark(r)
 
                     draw_button(surf, WIDTH * 0.75 - 120 // 2, y + h + 5, 120, 30, "Unequip Unit")
                     w, h = 100, 30
@@ -1828,7 +1990,7 @@ def main():
         # screen.blit(txt := FONT.render("Toybox Tactics Devlog #2", True, 'black'), (WIDTH // 2 - txt.get_width() // 2 + 2, HEIGHT - txt.get_height() - 23))
         # screen.blit(txt := FONT.render("Toybox Tactics Devlog #2", True, 'white'), (WIDTH // 2 - txt.get_width() // 2, HEIGHT - txt.get_height() - 25))
 
-        pygame.display.flip()
+        present()
     
     pygame.quit()
 
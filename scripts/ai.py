@@ -0,0 +1,236 @@
+import copy
+import time
+import threading
+import numpy as np
+
+from . import combat
+from .pathing import UNREACHABLE
+
+# decisions are ("attack", (x, y)), ("move", (x, y)) or ("wait", None)
+# danger is a grid of expected incoming damage, field a grid of steps to the nearest target,
+# sight an AttackRange for line of sight
+
+def weapon_range(unit):
+    return unit.weapon.range if unit.weapon else 1
+
+def expected_damage(attacker, targets):
+    # mean damage of one swing against each target, hit and protection rolls included
+    return combat.expected_damage(combat.stats([attacker]), combat.stats(targets))
+
+def finish(steps):
+    # run a planner's steps() to the end in one go
+    while True:
+        try:
+            next(steps)
+        except StopIteration as e:
+            return e.value
+
+class Planner:
+    def start_turn(self):
+        pass
+
+    def plan(self, unit, moves, targets, danger=None, field=None, sight=None):
+        return ("wait", None)
+
+    def steps(self, unit, moves, targets, danger=None, field=None, sight=None):
+        # plan() split into pieces: yields between chunks of work and returns the decision
+        return self.plan(unit, moves, targets, danger, field, sight)
+        yield
+
+class GreedyPlanner(Planner):
+    # walk at the closest target and hit it once adjacent
+    def plan(self, unit, moves, targets, danger=None, field=None, sight=None):
+        closest = min(targets, key=lambda t: abs(t.x - unit.x) + abs(t.y - unit.y))
+
+        if abs(closest.x - unit.x) + abs(closest.y - unit.y) <= 1:
+            return ("attack", (closest.x, closest.y))
+
+        best = None
+        best_distance = 0xffff
+
+        for tile in moves:
+            distance = abs(tile[0] - closest.x) + abs(tile[1] - closest.y)
+
+            if distance < best_distance:
+                best_distance = distance
+                best = tile
+
+        return ("move", best)
+
+class UtilityPlanner(Planner):
+    def __init__(self, budget=0.004, caution=0.5, chunk=64):
+        # seconds of thinking per enemy turn before falling back to the greedy plan
+        self.budget = budget
+        # how much a tile's expected incoming damage, as a share of health, counts against it
+        self.caution = caution
+        # tiles scored between yields
+        self.chunk = chunk
+        self.spent = 0.0
+        self.fallback = GreedyPlanner()
+
+    def start_turn(self):
+        self.spent = 0.0
+
+    def plan(self, unit, moves, targets, danger=None, field=None, sight=None):
+        return finish(self.steps(unit, moves, targets, danger, field, sight))
+
+    def steps(self, unit, moves, targets, danger=None, field=None, sight=None):
+        if self.spent >= self.budget:
+            return self.fallback.plan(unit, moves, targets)
+
+        thinking = self.think(unit, moves, targets, danger, field, sight)
+
+        # cpu time of whichever thread is thinking, so waiting on the GIL isn't counted
+        while True:
+            start = time.thread_time()
+
+            try:
+                next(thinking)
+            except StopIteration as e:
+                return e.value
+            finally:
+                self.spent += time.thread_time() - start
+
+            yield
+
+    def think(self, unit, moves, targets, danger=None, field=None, sight=None):
+        here = (int(unit.x), int(unit.y))
+
+        # every (tile, target) pair at once: rows are tiles to stand on, columns are targets
+        tiles = np.array([here] + list(moves)).reshape(-1, 2)
+        spots = np.array([(t.x, t.y) for t in targets]).reshape(-1, 2)
+
+        health = np.array([t.health for t in targets], np.float64)
+        damage = expected_damage(unit, targets)
+
+        # favour hits that take off a big share of what's left, and finishing blows most of all
+        value = np.minimum(damage, health) / np.maximum(health, 1) + (damage >= health)
+
+        steps = np.abs(tiles - tiles[0]).sum(axis=1)
+
+        if danger is not None:
+            incoming = danger[tiles[:, 1], tiles[:, 0]] * (1 - unit.calculate_protection_chance())
+            risk = np.minimum(incoming / max(unit.health, 1), 1) * self.caution
+        else:
+            risk = np.zeros(len(tiles))
+
+        closest = np.empty(len(tiles), np.int64)
+        best, best_tile, best_target = -np.inf, 0, 0
+
+        for start in range(0, len(tiles), self.chunk):
+            rows = slice(start, start + self.chunk)
+
+            distance = np.abs(tiles[rows, None, :] - spots[None, :, :]).sum(axis=2)
+            in_range = (distance > 0) & (distance <= weapon_range(unit))
+
+            if sight is not None:
+                for i, j in zip(*np.nonzero(in_range)):
+                    in_range[i, j] = sight.has_sight(tuple(tiles[start + i].tolist()), tuple(spots[j].tolist()))
+
+            closest[rows] = distance.min(axis=1)
+
+            score = np.where(in_range, value[None, :], -np.inf) - (steps[rows] * 0.01 + risk[rows])[:, None]
+
+            tile, target = np.unravel_index(np.argmax(score), score.shape)
+
+            if score[tile, target] > best:
+                best, best_tile, best_target = score[tile, target], start + tile, target
+
+            yield
+
+        if np.isfinite(best):
+            if best_tile == 0:
+                return ("attack", tuple(spots[best_target].tolist()))
+
+            return ("move", tuple(tiles[best_tile].tolist()))
+
+        if len(moves) == 0:
+            return ("wait", None)
+
+        # nothing in reach this turn, close in on the nearest target instead,
+        # going around obstacles when there's a flow field to follow
+        if field is not None and field[here[1], here[0]] != UNREACHABLE:
+            closest = field[tiles[:, 1], tiles[:, 0]].astype(np.int64)
+
+        tile = np.argmin(closest[1:] + steps[1:] * 0.01 + risk[1:] * 4) + 1
+
+        if closest[tile] >= closest[0]:
+            return ("wait", None)
+
+        return ("move", tuple(tiles[tile].tolist()))
+
+class AIWorker:
+    def __init__(self, planner, threaded=True, time_slice=0.002):
+        self.planner = planner
+        self.threaded = threaded
+        # seconds per frame the cooperative fallback may think for
+        self.time_slice = time_slice
+
+        self.job = None
+        self.result = None
+        self.steps = None
+
+    @property
+    def busy(self):
+        return self.job is not None
+
+    def submit(self, unit, moves, targets, danger=None, field=None, sight=None):
+        # the planner works on copies, so the main loop is free to keep animating the real units
+        unit = copy.copy(unit)
+        targets = [copy.copy(t) for t in targets]
+        moves = list(moves)
+        danger = None if danger is None else danger.copy()
+
+        job = object()
+        self.job = job
+        self.result = None
+
+        steps = self.planner.steps(unit, moves, targets, danger, field, sight)
+
+        if self.threaded:
+            threading.Thread(target=self.run, args=(job, steps), daemon=True).start()
+        else:
+            self.steps = steps
+
+    def run(self, job, steps):
+        # an error is handed over like an answer, so poll() raises it on the main thread
+        try:
+            outcome = (finish(steps), None)
+        except Exception as e:
+            outcome = (None, e)
+
+        # a cancelled job's answer is dropped
+        if job is self.job:
+            self.result = (job, outcome)
+
+    def cancel(self):
+        self.job = None
+        self.result = None
+        self.steps = None
+
+    def poll(self):
+        # the decision once it's ready, otherwise None
+        if self.job is None:
+            return None
+
+        if not self.threaded:
+            end = time.perf_counter() + self.time_slice
+
+            try:
+                while time.perf_counter() < end:
+                    next(self.steps)
+            except StopIteration as e:
+                self.result = (self.job, (e.value, None))
+            except Exception as e:
+                self.result = (self.job, (None, e))
+
+        if self.result is None or self.result[0] is not self.job:
+            return None
+
+        decision, error = self.result[1]
+        self.cancel()
+
+        if error is not None:
+            raise error
+
+        return decision
@@ -0,0 +1,68 @@
+import tcod.los
+
+# trees and rocks
+BLOCKS_SIGHT = (1, 2)
+
+# (dx, dy) offsets of every tile within a manhattan range, built once per range
+_diamonds = {}
+
+def diamond(r):
+    offsets = _diamonds.get(r)
+
+    if offsets is None:
+        offsets = tuple(
+            (dx, dy)
+            for dx in range(-r, r + 1)
+            for dy in range(-r, r + 1)
+            if 0 < abs(dx) + abs(dy) <= r
+        )
+
+        _diamonds[r] = offsets
+
+    return offsets
+
+class AttackRange:
+    # which tiles a unit can hit from where it stands; built per level, everything cached
+    def __init__(self, nature, world_size):
+        self.width, self.height = world_size
+        self.blocking = {
+            (x, y)
+            for y in range(self.height)
+            for x in range(self.width)
+            if nature[y * self.width + x] in BLOCKS_SIGHT
+        }
+
+        self.sight = {}
+        self.ranges = {}
+
+    def has_sight(self, a, b):
+        key = (a, b) if a <= b else (b, a)
+        seen = self.sight.get(key)
+
+        if seen is None:
+            line = tcod.los.bresenham(key[0], key[1]).tolist()
+            seen = not any(tuple(p) in self.blocking for p in line[1:-1])
+
+            self.sight[key] = seen
+
+        return seen
+
+    def tiles(self, x, y, r):
+        # frozenset of (x, y), so callers get O(1) membership
+        x, y = int(x), int(y)
+        key = (x, y, r)
+        tiles = self.ranges.get(key)
+
+        if tiles is None:
+            tiles = frozenset(
+                (x + dx, y + dy)
+                for dx, dy in diamond(r)
+                if 0 <= x + dx < self.width and 0 <= y + dy < self.height and self.has_sight((x, y), (x + dx, y + dy))
+            )
+
+            self.ranges[key] = tiles
+
+        return tiles
+
+    def of(self, unit):
+        return self.tiles(unit.x, unit.y, unit.weapon.range if unit.weapon else 1)
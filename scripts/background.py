@@ -0,0 +1,43 @@
+import pygame
+
+class DotPattern:
+    def __init__(self, size, spacing=50, shade=0.1):
+        self.size = size
+        self.spacing = spacing
+        self.shade = shade
+        self.strips = {}
+
+    def get_strip(self, phase):
+        # the dots only change size along x + y, so the screen repeats every (spacing, -spacing):
+        # one column, tall enough to cover every column once shifted, holds the whole frame
+        strip = self.strips.get(phase)
+
+        if strip is None:
+            w, h = self.size
+            s = self.spacing
+            c = int(256 * (1 - self.shade))
+
+            strip = pygame.Surface((s, h + w + s))
+            strip.fill('white')
+
+            for x in range(-1, 2):
+                for y in range(-1, (h + w) // s + 2):
+                    if (x + y) % 2 == 0:
+                        fx, fy = s / 2 + x * s - phase, s / 2 + y * s - phase
+                        q = 1 - abs(2 * ((fx + fy) / (w + h) - 0.5))
+                        r = s / 2 * q
+                        pygame.draw.circle(strip, (c, c, c), (fx, fy), r)
+
+            self.strips[phase] = strip
+
+        return strip
+
+    def draw(self, win, t):
+        # darkens whatever is already on win inside the dots
+        w, h = self.size
+        s = self.spacing
+
+        strip = self.get_strip(int(t) % s)
+
+        for k in range(w // s + 1):
+            win.blit(strip, (k * s, 0), (0, k * s, s, h), special_flags=pygame.BLEND_MULT)
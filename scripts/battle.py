@@ -0,0 +1,334 @@
+import copy
+import json
+import random
+
+from .unit import ScoutUnit, SoldierUnit, HeavyUnit, Bori
+from .item import Item
+from . import combat
+from .pathing import SolidsMap, ReachabilityCache, movement_kind
+from .attack import AttackRange
+
+# actions are ("place", (x, y)), ("move", (x, y)), ("attack", (x, y)), ("item", item class) or ("wait", None)
+# apply() hands back what happened as a list of events, e.g. ("hit", unit, damage) or ("burn", unit, damage)
+
+# every gameplay roll goes through an rng handed in, one random.Random per battle, so a battle
+# replays the same from its seed; the global random module is left to cosmetic things
+
+# scenery code of the tiles the party can be placed on
+PLACEMENT = 16
+
+UNIT_TYPES = {
+    'scout': ScoutUnit,
+    'soldier': SoldierUnit,
+    'heavy': HeavyUnit,
+    'bori': Bori,
+}
+
+def read_level(f):
+    with open(f, 'r') as file:
+        data = json.load(file)
+
+    world_size = (data['width'], data['height'])
+
+    nature = [data['scenery'][y][x] for y in range(world_size[1]) for x in range(world_size[0])]
+    units = [UNIT_TYPES[u['type']](True, u['x'], u['y']) for u in data['units'] if u['type'] in UNIT_TYPES]
+
+    # optional per-tile movement costs, same layout as the scenery
+    move_costs = data.get('move_costs')
+
+    return world_size, data['schema'], nature, units, data['during_battle_dialogue'], data['post_battle_dialogue'], data['available_sidequests'], data['next_level'], data['reward'], move_costs
+
+def resolve_attack(attacker, defender, rng=random):
+    # one swing: ("missed", 0), ("protected", 0) or ("hit", damage), already taken off the defender
+    outcome, damage, ignite = combat.resolve(combat.stats([attacker]), combat.stats([defender]), combat.draw(rng, 1))
+
+    if ignite[0]:
+        defender.onfire = True
+
+    d = int(damage[0])
+    defender.health -= d
+
+    return (combat.OUTCOMES[outcome[0]], d)
+
+def burn(unit, rng=random):
+    # fire damage taken when a burning unit's go comes up; half the time it goes out after
+    q = rng.randint(0, 10)
+    unit.health = max(0, unit.health - q)
+
+    if unit.health > 0 and rng.random() <= 0.5:
+        unit.onfire = False
+
+    return q
+
+def kill_reward(rng=random):
+    # buttons dropped by a defeated enemy
+    return rng.randint(6, 12)
+
+def new_seed():
+    # drawn from the os, so picking a seed doesn't disturb any stream
+    return random.SystemRandom().randrange(1 << 32)
+
+def spawn(unit):
+    # a fresh copy for one battle; the character and gear are only read, so they're shared
+    unit = copy.copy(unit)
+    unit.path = []
+    unit.particles = []
+
+    return unit
+
+class BattleState:
+    # the rules of one battle with nothing to draw: placement, moves, attacks, items, xp, fire and turns
+    def __init__(self, nature, world_size, enemies, party, inventory=None, move_costs=None, seed=None):
+        self.world_size = world_size
+
+        self.seed = new_seed() if seed is None else seed
+        self.rng = random.Random(self.seed)
+        self.nature = list(nature)
+
+        self.enemy_units = [spawn(u) for u in enemies]
+        self.friendly_units = []
+        self.units = []
+
+        # placed one at a time in this order
+        self.party = list(party)
+        self.inventory = dict(inventory or {})
+
+        self.turn = 0
+        self.current = 0
+        self.selected_unit = None
+
+        self.buttons = 0
+        # party members knocked out by the enemy, they rejoin the roster after the battle
+        self.fallen = []
+
+        self.winner = None
+        self.placed = False
+
+        self.solids = SolidsMap(self.nature, world_size, move_costs)
+        self.attack_range = AttackRange(self.nature, world_size)
+        self.reachability = ReachabilityCache()
+
+    @classmethod
+    def from_file(cls, f, party, inventory=None, seed=None):
+        world_size, _, nature, units, *_, move_costs = read_level(f)
+
+        return cls(nature, world_size, units, party, inventory, move_costs, seed)
+
+    @property
+    def done(self):
+        return self.winner is not None
+
+    def spots(self):
+        w = self.world_size[0]
+        return [(i % w, i // w) for i, n in enumerate(self.nature) if n == PLACEMENT]
+
+    def side(self):
+        return self.enemy_units if self.turn & 1 else self.friendly_units
+
+    def opponents(self):
+        return self.friendly_units if self.turn & 1 else self.enemy_units
+
+    def moves(self, unit=None):
+        unit = unit or self.selected_unit
+        return self.reachability.reachable(self.solids, int(unit.x), int(unit.y), unit.max_move, movement_kind(unit))
+
+    def unit_at(self, tile):
+        return next((u for u in self.units if (u.x, u.y) == tile), None)
+
+    def legal_actions(self):
+        if self.done:
+            return []
+
+        if not self.placed:
+            return [("place", tile) for tile in self.spots()]
+
+        unit = self.selected_unit
+
+        actions = [("move", tile) for tile in self.moves(unit)]
+
+        # swinging at allies or at empty tiles is allowed by apply() but never worth offering
+        reach = self.attack_range.of(unit)
+        actions += [("attack", (t.x, t.y)) for t in self.opponents() if (t.x, t.y) in reach]
+
+        if not self.turn & 1:
+            actions += [("item", k) for k, v in self.inventory.items() if issubclass(k, Item) and v > 0 and not k().requires_target]
+
+        actions.append(("wait", None))
+
+        return actions
+
+    def apply(self, action):
+        kind, arg = action
+        events = []
+
+        if self.done:
+            return events
+
+        if kind == "place":
+            self.place(arg, events)
+            return events
+
+        unit = self.selected_unit
+
+        # anything the game wouldn't let you click on is ignored
+        match kind:
+            case "move":
+                # staying put still spends the move, like a path that goes nowhere in the game
+                if arg != (unit.x, unit.y) and arg not in self.moves(unit):
+                    return events
+
+                self.solids.move(unit.x, unit.y, *arg)
+                unit.x = unit.target_x = unit.draw_x = arg[0]
+                unit.y = unit.target_y = unit.draw_y = arg[1]
+
+                events.append(("move", unit, arg))
+
+                unit.action_points -= 1
+            case "attack":
+                in_range = arg in self.attack_range.of(unit)
+                target = self.unit_at(arg)
+
+                if self.turn & 1:
+                    # the enemy only ever goes for the party, and gives up its go when it can't
+                    if target in self.friendly_units and in_range:
+                        self.attack(unit, target, events)
+                    else:
+                        unit.action_points = 0
+                elif not in_range:
+                    return events
+                elif target and target is not unit:
+                    self.attack(unit, target, events)
+
+                unit.action_points -= 1
+            case "item":
+                if self.turn & 1 or not self.inventory.get(arg):
+                    return events
+
+                self.inventory[arg] -= 1
+                o = arg().on_use(unit, None)
+                events.append(("item", unit, o))
+
+                unit.action_points -= 1
+            case "wait":
+                unit.action_points = 0
+            case _:
+                raise ValueError(f"unknown action {kind}")
+
+        self.check_winner()
+
+        if not self.done and unit.action_points <= 0:
+            self.end_action(events)
+
+        return events
+
+    def place(self, tile, events):
+        if self.placed or tile not in self.spots():
+            return
+
+        unit = self.party[len(self.friendly_units)]
+        unit.health = unit.max_health
+        unit.action_points = unit.max_action_points
+        unit.x = unit.target_x = unit.draw_x = tile[0]
+        unit.y = unit.target_y = unit.draw_y = tile[1]
+
+        self.friendly_units.append(unit)
+        self.nature[tile[1] * self.world_size[0] + tile[0]] = 0
+
+        events.append(("place", unit, tile))
+
+        if len(self.friendly_units) == len(self.party):
+            self.placed = True
+
+            self.nature = [n % PLACEMENT for n in self.nature]
+
+            self.units = self.friendly_units + self.enemy_units
+            self.current = 0
+            self.selected_unit = self.units[0]
+
+            self.solids.set_terrain(self.nature)
+            self.solids.occupy(self.units)
+
+    def attack(self, attacker, defender, events):
+        if defender.health <= 0:
+            return
+
+        outcome, d = resolve_attack(attacker, defender, self.rng)
+        events.append((outcome, defender if outcome != "missed" else attacker, d))
+
+        if defender.health <= 0:
+            if defender in self.friendly_units:
+                if self.turn & 1:
+                    self.fallen.append(defender)
+            elif attacker.give_xp(defender.xp_given, self.rng):
+                events.append(("level_up", attacker, defender.xp_given))
+            else:
+                events.append(("xp", attacker, defender.xp_given))
+
+            if defender in self.enemy_units:
+                n = kill_reward(self.rng)
+                self.buttons += n
+                events.append(("buttons", attacker, n))
+
+            self.remove(defender, events)
+
+    def remove(self, unit, events):
+        (self.friendly_units if unit in self.friendly_units else self.enemy_units).remove(unit)
+        self.units.remove(unit)
+        self.solids.remove(unit.x, unit.y)
+
+        events.append(("defeated", unit, 0))
+
+    def check_winner(self):
+        if not self.placed:
+            return
+
+        if len(self.friendly_units) == 0:
+            self.winner = "enemy"
+        elif len(self.enemy_units) == 0:
+            self.winner = "player"
+
+    def activate(self, index, events):
+        # a unit's go comes up; burning units take their fire damage first
+        side = self.side()
+        unit = side[index]
+
+        if unit.onfire:
+            q = burn(unit, self.rng)
+            events.append(("burn", unit, q))
+
+            if unit.health <= 0:
+                self.remove(unit, events)
+                self.check_winner()
+
+    def end_action(self, events):
+        unit = self.selected_unit
+        unit.done_with_turn = True
+
+        if all(u.done_with_turn for u in self.side()):
+            # hand the turn over to the other side
+            self.turn += 1
+
+            events.append(("turn", None, self.turn))
+
+            self.activate(0, events)
+            if self.done:
+                return
+
+            self.current = 0
+
+            for u in self.units:
+                u.done_with_turn = False
+        else:
+            side = self.side()
+
+            self.activate((self.current + 1) % len(side), events)
+            if self.done:
+                return
+
+            self.current += 1
+            if self.current >= len(side):
+                self.current = 0
+
+        self.selected_unit = self.side()[self.current]
+        self.selected_unit.action_points = self.selected_unit.max_action_points
+        self.selected_unit.done_with_turn = False
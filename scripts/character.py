@@ -5,6 +5,44 @@ import json
 import os
 import pygame.gfxdraw
 
+from collections import OrderedDict
+
+# tinted copies of the paper texture, one per part color
+_tinted_textures = {}
+_paper_sheets = {}
+
+def tinted_texture(tex, color):
+    key = (id(tex), color)
+    t = _tinted_textures.get(key)
+
+    if t is None:
+        t = tex.copy()
+
+        s = pygame.Surface(t.get_size())
+        s.fill(color)
+
+        t.blit(s, (0, 0), special_flags=pygame.BLEND_RGB_MULT)
+
+        _tinted_textures[key] = t
+
+    return t
+
+def paper_sheet(tex, size):
+    # the texture tiled over a whole character frame so it can be multiplied on in one blit
+    key = (id(tex), size)
+    sheet = _paper_sheets.get(key)
+
+    if sheet is None:
+        sheet = pygame.Surface(size)
+
+        for x in range(0, size[0], tex.get_width()):
+            for y in range(0, size[1], tex.get_height()):
+                sheet.blit(tex, (x, y))
+
+        _paper_sheets[key] = sheet
+
+    return sheet
+
 class Part:
     def __init__(self, name, color):
         self.name = name
@@ -46,14 +84,7 @@ class Poly(Part):
             o /= 2
         
         if draw_tex:
-            t = _tex.copy()
-
-            s = pygame.Surface(t.get_size())
-            s.fill(self.color)
-
-            t.blit(s, (0, 0), special_flags=pygame.BLEND_RGB_MULT)
-            
-            pygame.gfxdraw.textured_polygon(win, [(x + p[0] * scale, y + p[1] * scale + o) for p in self.points], t, 0, 0)
+            pygame.gfxdraw.textured_polygon(win, [(x + p[0] * scale, y + p[1] * scale + o) for p in self.points], tinted_texture(_tex, self.color), 0, 0)
         else:
             pygame.draw.polygon(win, self.color, [(x + p[0] * scale, y + p[1] * scale + o) for p in self.points])
 
@@ -106,33 +137,80 @@ class Line(Part):
 
         return min(hip_point.x, foot_point.x) / scale, min(hip_point.y, foot_point.y) / scale
 
+BOB_FRAMES = 16
+STEP_FRAMES = 16
+
+# extract the outline from the mask every frame instead of using the one stored with the body
+LIVE_OUTLINES = False
+
+# paper look: multiply the texture over the whole body at once instead of texturing each poly
+COMPOSITE_PAPER = True
+
+class SpriteCache:
+    def __init__(self, capacity, pool=None):
+        self.capacity = capacity
+        self.frames = OrderedDict()
+
+        # a SurfacePool to report renders to, if anyone's counting
+        self.pool = pool
+
+    def get(self, key):
+        frame = self.frames.get(key)
+
+        if frame is not None:
+            self.frames.move_to_end(key)
+
+        return frame
+
+    def put(self, key, frame):
+        # only ever called with a frame that was just rendered
+        if self.pool is not None:
+            self.pool.count()
+
+        self.frames[key] = frame
+        self.frames.move_to_end(key)
+
+        while len(self.frames) > self.capacity:
+            self.frames.popitem(last=False)
+
+    def clear(self):
+        self.frames.clear()
+
+# bodies are shared by every unit using the same template, finished frames add the outline on top
+BODY_CACHE = SpriteCache(128)
+FRAME_CACHE = SpriteCache(256)
+
 class Character:
-    def __init__(self, parts: list[Part]):
+    def __init__(self, parts: list[Part], template=None):
         self.parts = parts
+        self.template = template
         self.x = 0
         self.y = 0
         self.scale = 30
         self.body_off_mult, self.limb_off_mult = random.randint(30, 35) / 10, 4
         self.surf = None
-    
-    def draw(self, win, cam, limb_move, invert_limbs, draw_tex, tex, color='white', selected=False):
-        time = pygame.time.get_ticks() / 1000
+        self.padding = 4
 
-        body_offset_y = math.sin(time * self.body_off_mult) * 0.05
-        
-        if limb_move:
-            limb_offset = math.fmod(time * self.limb_off_mult, 2)
-
-            if invert_limbs: limb_offset = 2 - limb_offset
+    def prepare_texture(self, tex):
+        if COMPOSITE_PAPER:
+            paper_sheet(tex, (self.scale * 4, self.scale * 4))
         else:
-            limb_offset = 0
+            for part in self.parts:
+                if isinstance(part, Poly):
+                    tinted_texture(tex, part.color)
 
-        self.surf = pygame.Surface((self.scale * 4, self.scale * 4), pygame.SRCALPHA)
+    def render_body(self, bob_frame, step_frame, draw_tex, tex):
+        body_offset_y = math.sin(math.tau * bob_frame / BOB_FRAMES) * 0.05
+        limb_offset = 2 * (step_frame + 0.5) / STEP_FRAMES if step_frame is not None else 0
+
+        surf = pygame.Surface((self.scale * 4, self.scale * 4), pygame.SRCALPHA)
 
         self.minx, self.miny = 100, 100
 
+        composite = draw_tex and COMPOSITE_PAPER
+
         for part in self.parts:
-            mx, my = part.draw(self.surf, self.scale * 2, self.scale * 2, self.scale, body_offset_y, limb_offset, draw_tex, tex)
+            mx, my = part.draw(surf, self.scale * 2, self.scale * 2, self.scale, body_offset_y, limb_offset, draw_tex and not composite, tex)
             
             if mx < self.minx: self.minx = mx
             if my < self.miny: self.miny = my
@@ -142,20 +220,74 @@ class Character:
         self.miny += 1
         self.miny /= 2
 
-        outline = pygame.mask.from_surface(self.surf).outline()
+        if composite:
+            surf.blit(paper_sheet(tex, surf.get_size()), (0, 0), special_flags=pygame.BLEND_RGB_MULT)
+
+        return surf
+
+    def render_frame(self, body, outline, color, w):
+        p = self.padding
+
+        frame = pygame.Surface((body.get_width() + p * 2, body.get_height() + p * 2), pygame.SRCALPHA)
+        frame.blit(body, (p, p))
+
+        pygame.draw.polygon(frame, color, [(p + o[0], p + o[1]) for o in outline], w)
+
+        return frame
+
+    def draw(self, win, cam, limb_move, invert_limbs, draw_tex, tex, color='white', selected=False):
+        time = pygame.time.get_ticks() / 1000
+
+        # quantize the bob and step cycles so every unit of a template shares the same few frames
+        bob_frame = int(time * self.body_off_mult / math.tau * BOB_FRAMES) % BOB_FRAMES
+
+        if limb_move:
+            limb_offset = math.fmod(time * self.limb_off_mult, 2)
+
+            if invert_limbs: limb_offset = 2 - limb_offset
+
+            step_frame = int(limb_offset / 2 * STEP_FRAMES) % STEP_FRAMES
+        else:
+            step_frame = None
 
         w = 2
 
         if selected:
             w = round(2 + math.sin(pygame.time.get_ticks() / 200))
+            color = 'yellow'
+
+        template = self.template if self.template is not None else id(self)
+
+        body_key = (template, draw_tex, bob_frame, step_frame)
+        cached = BODY_CACHE.get(body_key)
+
+        if cached is None:
+            body = self.render_body(bob_frame, step_frame, draw_tex, tex)
+            # the outline only depends on the body, so it's extracted once and shared by every color and width
+            cached = (body, pygame.mask.from_surface(body).outline())
+            BODY_CACHE.put(body_key, cached)
+
+        body, outline = cached
+
+        self.surf = body
+
+        if LIVE_OUTLINES:
+            outline = pygame.mask.from_surface(body).outline()
+
+            x, y = self.x - cam.x - body.get_width() / 2, self.y - cam.y - body.get_height() / 2
+
+            win.blit(body, (x, y))
+            pygame.draw.polygon(win, color, [(x + o[0], y + o[1]) for o in outline], w)
+            return
+
+        frame_key = (template, color, selected, w, draw_tex, bob_frame, step_frame)
+        frame = FRAME_CACHE.get(frame_key)
+
+        if frame is None:
+            frame = self.render_frame(body, outline, color, w)
+            FRAME_CACHE.put(frame_key, frame)
 
-        win.blit(self.surf, (self.x - cam.x - self.surf.get_width() / 2, self.y - cam.y - self.surf.get_height() / 2))
-        pygame.draw.polygon(win, color if not selected else 'yellow', [(
-                self.x - cam.x - self.surf.get_width() / 2 + o[0],
-                self.y - cam.y - self.surf.get_height() / 2 + o[1]
-            )
-            for o in outline
-        ], w)
+        win.blit(frame, (self.x - cam.x - frame.get_width() / 2, self.y - cam.y - frame.get_height() / 2))
 
 def character_from_file(f):
     data = json.load(open(f))
@@ -172,4 +304,4 @@ def character_from_file(f):
             case _:
                 pass
 
-    return Character(parts)
\ No newline at end of file
+    return Character(parts, f)
\ No newline at end of file
@@ -0,0 +1,79 @@
+import numpy as np
+
+from .unit import MAX_STAT_LEVEL
+from .constants import DamageType
+
+# attack resolution for any number of attacks at once: every argument is an array (or something that
+# broadcasts to one), so a single swing and a simulator's thousands of hypothetical ones share the same code
+
+MISSED = 0
+PROTECTED = 1
+HIT = 2
+
+OUTCOMES = ["missed", "protected", "hit"]
+
+# uniform rolls used per attack, in this order: hit, protection, fire, strength, armor
+ROLLS = 5
+
+def hit_chance(accuracy):
+    # Unit.calculate_hit_chance over arrays
+    return 0.75 + np.maximum(0, np.log10(accuracy) / 8)
+
+def protection_chance(defense):
+    # Unit.calculate_protection_chance over arrays
+    return -1 + np.power(2, np.asarray(defense) / (MAX_STAT_LEVEL + 1))
+
+def stats(units):
+    # the columns combat reads, one row per unit
+    return {
+        "accuracy": np.array([u.accuracy for u in units], np.float64),
+        "strength": np.array([u.strength for u in units], np.int64),
+        "damage": np.array([u.weapon.damage if u.weapon else 0 for u in units], np.int64),
+        "fire": np.array([bool(u.weapon) and u.weapon.damage_type == DamageType.FIRE for u in units]),
+        "defense": np.array([u.defense for u in units], np.float64),
+        "armor": np.array([u.armor.protection_value if u.armor else 0 for u in units], np.int64),
+    }
+
+def draw(rng, n):
+    # (ROLLS, n) uniform rolls from a numpy Generator or a random.Random
+    if isinstance(rng, np.random.Generator):
+        return rng.random((ROLLS, n))
+
+    return np.array([rng.random() for _ in range(ROLLS * n)]).reshape(n, ROLLS).T
+
+def resolve(attackers, defenders, rolls):
+    # outcome, damage and whether the defender catches fire for each attacker/defender pair
+    hit, protect, fire, strength, armor = rolls
+
+    landed = hit <= hit_chance(attackers["accuracy"])
+    protected = landed & (protect <= protection_chance(defenders["defense"]))
+    hits = landed & ~protected
+
+    # randint(0, n) is floor(u * (n + 1)) for a uniform u
+    damage = attackers["damage"] + np.floor(strength * (attackers["strength"] + 1)).astype(np.int64)
+    damage = np.maximum(0, damage - np.floor(armor * (defenders["armor"] + 1)).astype(np.int64))
+
+    outcome = np.where(hits, HIT, np.where(protected, PROTECTED, MISSED))
+    ignite = hits & attackers["fire"] & (fire <= 0.5)
+
+    return outcome, np.where(hits, damage, 0), ignite
+
+def base_damage(attackers):
+    # weapon damage plus the mean strength roll
+    return attackers["damage"] + attackers["strength"] / 2
+
+def swing_damage(attackers):
+    # what one attack is worth before the target's protection and armor
+    return hit_chance(attackers["accuracy"]) * base_damage(attackers)
+
+def expected_damage(attackers, defenders):
+    # mean damage of one swing for each pair, hit and protection rolls included
+    hit = hit_chance(attackers["accuracy"])
+    protect = protection_chance(defenders["defense"])
+
+    damage = np.maximum(0, base_damage(attackers) - defenders["armor"] / 2)
+
+    # half the time it sets them alight for an average of 5 a turn
+    damage = damage + attackers["fire"] * 2.5
+
+    return hit * (1 - protect) * damage
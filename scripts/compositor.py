@@ -0,0 +1,38 @@
+import pygame
+
+class DirtyRectCompositor:
+    def __init__(self):
+        self.rects = []
+        self.full = True
+
+        # last seen (state, rect) of every tracked widget
+        self.states = {}
+
+    def mark(self, rect):
+        self.rects.append(pygame.Rect(rect))
+
+    def mark_all(self):
+        self.full = True
+
+    def track(self, key, rect, state):
+        rect = pygame.Rect(rect)
+        last = self.states.get(key)
+
+        if last is None or last[0] != state or last[1] != rect:
+            if last is not None:
+                self.mark(last[1])
+            self.mark(rect)
+
+            self.states[key] = (state, rect)
+
+    def has_changes(self):
+        return self.full or bool(self.rects)
+
+    def present(self):
+        if self.full:
+            pygame.display.flip()
+        elif self.rects:
+            pygame.display.update(self.rects)
+
+        self.rects.clear()
+        self.full = False
@@ -3,21 +3,60 @@ import math
 
 WIDTH, HEIGHT = 900, 600
 
+class GlyphAtlas:
+    def __init__(self, font, color, pool=None):
+        self.font = font
+        self.color = color
+        self.glyphs = {}
+        self.pool = pool
+
+    def get(self, char):
+        glyph = self.glyphs.get(char)
+
+        if glyph is None:
+            glyph = self.font.render(char, True, self.color)
+            self.glyphs[char] = glyph
+
+            if self.pool is not None:
+                self.pool.count()
+
+        return glyph
+
 class DialogueManager:
-    def __init__(self, font, title_font, text_color='black', border_color='white') -> None:
+    def __init__(self, font, title_font, text_color='black', border_color='white', pool=None) -> None:
         self.queued_text = []
         self.text_color = text_color
         self.border_color = border_color
         self.font = font
         self.title_font = title_font
 
+        self.atlases = {}
+        # a SurfacePool to report glyphs and composed boxes to, if anyone's counting
+        self.pool = pool
+
+        # the composed box for queued_text[0], rebuilt when the queue advances
+        self.box_text = None
+        self.box = None
+        self.shadow = None
+
+    def get_atlas(self, font, color):
+        atlas = self.atlases.get((font, color))
+
+        if atlas is None:
+            atlas = GlyphAtlas(font, color, self.pool)
+            self.atlases[(font, color)] = atlas
+
+        return atlas
+
     def calculate_bounds(self):
-        return max([self.font.render(self.remove_tags(x), True, 'black').get_width() for x in self.queued_text[0]]), 45 + 25 * (len(self.queued_text[0]) - 1)
+        return max([self.font.size(self.remove_tags(x))[0] for x in self.queued_text[0]]), 45 + 25 * (len(self.queued_text[0]) - 1)
 
     def on_confirm(self):
         if len(self.queued_text):
             self.queued_text.pop(0)
 
+        self.box_text = None
+
     def queue_text(self, text):
         self.queued_text.append(text)
 
@@ -41,8 +80,6 @@ class DialogueManager:
         return final
 
     def draw_tagged_line(self, win, x, y, line, font, base_color='black'):
-        fline = ""
-
         color = base_color
 
         drawing = True
@@ -59,29 +96,45 @@ class DialogueManager:
                 continue
 
             if drawing:
-                win.blit(t := font.render(char, True, color), (cx, y))
-                fline += char
+                win.blit(t := self.get_atlas(font, color).get(char), (cx, y))
                 cx += t.get_width()
             else:
                 color += char
 
+    def compose(self):
+        w, h = self.calculate_bounds()
+        w += 30
+        h += 15
+
+        if self.pool is not None:
+            self.pool.count(2)
+
+        self.shadow = pygame.Surface((w, h), pygame.SRCALPHA)
+        pygame.draw.rect(self.shadow, (0, 0, 0, 128), (0, 0, w, h), 0, 8)
+
+        self.box = pygame.Surface((w, h), pygame.SRCALPHA)
+        pygame.draw.rect(self.box, '#404040', (0, 0, w, h), 0, 8)
+        pygame.draw.rect(self.box, self.border_color, (0, 0, w, h), 2, 8)
+
+        self.draw_tagged_line(self.box, 5, 5, self.queued_text[0][0], self.title_font, self.text_color)
+
+        for i, line in enumerate(self.queued_text[0][1:]):
+            self.draw_tagged_line(self.box, 5, 45 + 25 * i, line, self.font, self.text_color)
+
+        self.box_text = self.queued_text[0]
+
     def draw(self, win):
         if self.has_dialogue():
-            w, h = self.calculate_bounds()
-            w += 30
-            h += 15
+            if self.box_text is not self.queued_text[0]:
+                self.compose()
+
+            w, h = self.box.get_size()
 
             x, y = WIDTH // 2 - w // 2, HEIGHT * 0.75 - h // 2
             
-            s = pygame.Surface((w, h), pygame.SRCALPHA)
-            pygame.draw.rect(s, (0, 0, 0, 128), (0, 0, w, h), 0, 8)
             t = 3 + math.sin(pygame.time.get_ticks() / 300) * 2
-            win.blit(s, (x, y))
-
-            pygame.draw.rect(win, '#404040', (x - t, y - t, w, h), 0, 8)
-            pygame.draw.rect(win, self.border_color, (x - t, y - t, w, h), 2, 8)
-
-            self.draw_tagged_line(win, x + 5 - t, y + 5 - t, self.queued_text[0][0], self.title_font, self.text_color)
+            win.blit(self.shadow, (x, y))
+            win.blit(self.box, (x - t, y - t))
 
-            for i, line in enumerate(self.queued_text[0][1:]):
-                self.draw_tagged_line(win, x + 5 - t, y + 45 + 25 * i - t, line, self.font, self.text_color)
\ No newline at end of file
+            # everything the wobbling box can cover
+            return pygame.Rect(x - 5, y - 5, w + 5, h + 5)
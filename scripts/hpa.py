@@ -0,0 +1,286 @@
+import heapq
+import numpy as np
+
+from tcod import path
+
+UNREACHABLE = np.iinfo(np.int32).max
+
+def local_path(cost, start, goal):
+    # exact path inside a window of the cost grid as [[y, x], ...] without the start, None if there isn't one
+    if start == goal:
+        return []
+
+    finder = path.Pathfinder(path.SimpleGraph(cost=cost, cardinal=1, diagonal=0))
+    finder.add_root((start[1], start[0]))
+
+    p = finder.path_to((goal[1], goal[0])).tolist()
+
+    if len(p) < 2:
+        return None
+
+    return p[1:]
+
+def distances_from(cost, tile):
+    dist = path.maxarray(cost.shape, np.int32)
+    dist[tile[1], tile[0]] = 0
+
+    return path.dijkstra2d(dist, cost, 1, 0, out=dist)
+
+class HierarchicalPathfinder:
+    # splits the map into size x size clusters joined by portals on their borders, so a long
+    # search walks a small graph of portals and only refines the legs it actually uses
+    def __init__(self, solids, kind=None, size=16):
+        self.solids = solids
+        self.kind = kind
+        self.size = size
+
+        self.columns = -(-solids.width // size)
+        self.rows = -(-solids.height // size)
+
+        self.portals = {} # (cluster, cluster) -> [(tile, tile), ...]
+        self.across = {} # tile -> [tile on the other side, ...]
+        self.nodes = {} # cluster -> {tile, ...}
+        self.edges = {} # cluster -> {tile: {tile: cost}}
+
+        self.dirty = set()
+        self.touch_all()
+
+    @property
+    def cost(self):
+        return self.solids.cost_for(self.kind)
+
+    def touch(self, x, y):
+        self.dirty.add((int(x) // self.size, int(y) // self.size))
+
+    def touch_all(self):
+        self.dirty.update((i, j) for i in range(self.columns) for j in range(self.rows))
+
+    def bounds(self, cluster):
+        i, j = cluster
+        x0, y0 = i * self.size, j * self.size
+
+        return x0, y0, min(x0 + self.size, self.solids.width), min(y0 + self.size, self.solids.height)
+
+    def cluster_of(self, tile):
+        return (tile[0] // self.size, tile[1] // self.size)
+
+    def border(self, a, b):
+        # keyed top-left cluster first
+        return (a, b) if (a[1], a[0]) < (b[1], b[0]) else (b, a)
+
+    def neighbours(self, cluster):
+        i, j = cluster
+        for n in ((i - 1, j), (i + 1, j), (i, j - 1), (i, j + 1)):
+            if 0 <= n[0] < self.columns and 0 <= n[1] < self.rows:
+                yield n
+
+    def find_portals(self, a, b):
+        # a is left of or above b; one crossing per open run, two for long ones
+        cost = self.cost
+        ax0, ay0, ax1, ay1 = self.bounds(a)
+
+        if a[1] == b[1]:
+            cells = [((ax1 - 1, y), (ax1, y)) for y in range(ay0, ay1)]
+        else:
+            cells = [((x, ay1 - 1), (x, ay1)) for x in range(ax0, ax1)]
+
+        portals = []
+        run = []
+
+        for p, q in cells + [(None, None)]:
+            if p is not None and cost[p[1], p[0]] and cost[q[1], q[0]]:
+                run.append((p, q))
+                continue
+
+            if len(run) > 5:
+                portals += [run[0], run[-1]]
+            elif run:
+                portals.append(run[len(run) // 2])
+
+            run = []
+
+        return portals
+
+    def refresh(self):
+        if not self.dirty:
+            return
+
+        affected = set()
+
+        for cluster in self.dirty:
+            affected.add(cluster)
+
+            for n in self.neighbours(cluster):
+                affected.add(n)
+
+                key = self.border(cluster, n)
+
+                for p, q in self.portals.get(key, []):
+                    self.across[p].remove(q)
+                    self.across[q].remove(p)
+
+                self.portals[key] = self.find_portals(*key)
+
+                for p, q in self.portals[key]:
+                    self.across.setdefault(p, []).append(q)
+                    self.across.setdefault(q, []).append(p)
+
+        self.dirty.clear()
+
+        cost = self.cost
+
+        for cluster in affected:
+            nodes = set()
+
+            for n in self.neighbours(cluster):
+                for p, q in self.portals.get(self.border(cluster, n), []):
+                    nodes.add(p if self.cluster_of(p) == cluster else q)
+
+            x0, y0, x1, y1 = self.bounds(cluster)
+            window = cost[y0:y1, x0:x1]
+
+            edges = {}
+
+            for node in nodes:
+                dist = distances_from(window, (node[0] - x0, node[1] - y0))
+
+                edges[node] = {
+                    other: int(dist[other[1] - y0, other[0] - x0])
+                    for other in nodes
+                    if other != node and dist[other[1] - y0, other[0] - x0] < UNREACHABLE
+                }
+
+            self.nodes[cluster] = nodes
+            self.edges[cluster] = edges
+
+    def window_path(self, start, goal, radius):
+        w, h = self.solids.width, self.solids.height
+
+        x0, y0 = max(0, min(start[0], goal[0]) - radius), max(0, min(start[1], goal[1]) - radius)
+        x1, y1 = min(w, max(start[0], goal[0]) + radius + 1), min(h, max(start[1], goal[1]) + radius + 1)
+
+        p = local_path(self.cost[y0:y1, x0:x1], (start[0] - x0, start[1] - y0), (goal[0] - x0, goal[1] - y0))
+
+        if p is None:
+            return None
+
+        return [[y + y0, x + x0] for y, x in p]
+
+    def attach(self, tile, cluster):
+        # costs from a tile to every portal of its cluster
+        x0, y0, x1, y1 = self.bounds(cluster)
+        dist = distances_from(self.cost[y0:y1, x0:x1], (tile[0] - x0, tile[1] - y0))
+
+        return {
+            node: int(dist[node[1] - y0, node[0] - x0])
+            for node in self.nodes[cluster]
+            if dist[node[1] - y0, node[0] - x0] < UNREACHABLE
+        }
+
+    def links(self, node):
+        cluster = self.cluster_of(node)
+
+        yield from self.edges[cluster].get(node, {}).items()
+
+        # the matching tiles across the border
+        cost = self.cost
+        for other in self.across.get(node, ()):
+            yield other, int(cost[other[1], other[0]])
+
+    def path_to(self, x0, y0, x1, y1):
+        # same shape as tcod's path_to(...).tolist()[1:]: [[y, x], ...], empty when there's no way
+        start, goal = (int(x0), int(y0)), (int(x1), int(y1))
+
+        if start == goal or not self.cost[goal[1], goal[0]]:
+            return []
+
+        self.refresh()
+
+        # short hops get an exact search in a window around them
+        if abs(goal[0] - start[0]) + abs(goal[1] - start[1]) <= self.size:
+            p = self.window_path(start, goal, self.size // 2)
+            if p is not None:
+                return p
+
+        start_cluster, goal_cluster = self.cluster_of(start), self.cluster_of(goal)
+
+        outgoing = self.attach(start, start_cluster)
+        incoming = self.attach(goal, goal_cluster)
+
+        # the unit blocks its own tile, so a start on a cluster edge is never part of a portal;
+        # let it step straight into the clusters next door as well
+        cost = self.cost
+        entries = {}
+
+        for n in ((start[0] - 1, start[1]), (start[0] + 1, start[1]), (start[0], start[1] - 1), (start[0], start[1] + 1)):
+            if 0 <= n[0] < self.solids.width and 0 <= n[1] < self.solids.height and cost[n[1], n[0]] and self.cluster_of(n) != start_cluster:
+                entries[n] = self.attach(n, self.cluster_of(n))
+
+        def heuristic(tile):
+            return abs(tile[0] - goal[0]) + abs(tile[1] - goal[1])
+
+        best = {start: 0}
+        came_from = {}
+        queue = [(heuristic(start), 0, start)]
+
+        while queue:
+            _, d, node = heapq.heappop(queue)
+
+            if node == goal:
+                break
+
+            if d > best.get(node, d):
+                continue
+
+            if node == start:
+                links = list(outgoing.items()) + list(self.links(start))
+                links += [(n, int(cost[n[1], n[0]])) for n in entries]
+                if start_cluster == goal_cluster:
+                    links.append((goal, None))
+            else:
+                links = list(self.links(node))
+                if node in incoming:
+                    links.append((goal, incoming[node]))
+                if node in entries:
+                    links += list(entries[node].items())
+                    if self.cluster_of(node) == goal_cluster:
+                        links.append((goal, None))
+
+            for other, step in links:
+                if step is None:
+                    leg = self.leg(node, goal)
+                    if leg is None:
+                        continue
+                    step = sum(int(cost[y, x]) for y, x in leg)
+
+                if d + step < best.get(other, 0xffffffff):
+                    best[other] = d + step
+                    came_from[other] = node
+                    heapq.heappush(queue, (d + step + heuristic(other), d + step, other))
+
+        if goal not in came_from:
+            return []
+
+        route = [goal]
+        while route[-1] != start:
+            route.append(came_from[route[-1]])
+        route.reverse()
+
+        # refine each hop: within a cluster it's a local search, across a border it's one step
+        steps = []
+        for a, b in zip(route, route[1:]):
+            if self.cluster_of(a) == self.cluster_of(b):
+                steps += self.leg(a, b) or []
+            else:
+                steps.append([b[1], b[0]])
+
+        return steps
+
+    def leg(self, a, b):
+        x0, y0, x1, y1 = self.bounds(self.cluster_of(a))
+        p = local_path(self.cost[y0:y1, x0:x1], (a[0] - x0, a[1] - y0), (b[0] - x0, b[1] - y0))
+
+        if p is None:
+            return None
+
+        return [[y + y0, x + x0] for y, x in p]
@@ -0,0 +1,50 @@
+import numpy as np
+
+from tcod import path
+
+from . import combat
+from .ai import weapon_range
+from .pathing import movement_kind
+
+class InfluenceMap:
+    def __init__(self):
+        self.threat = None
+        self.damage = None
+        self.revision = 0
+
+    def invalidate(self):
+        self.threat = None
+
+    def update(self, attackers, solids, reachability):
+        # recomputed at most once between invalidations, normally once a turn
+        if self.threat is not None:
+            return
+
+        shape = (solids.height, solids.width)
+        everywhere = np.ones(shape, np.int8)
+
+        self.threat = np.zeros(shape, np.int16)
+        self.damage = np.zeros(shape, np.float64)
+
+        # what each attacker's swing is worth, all at once
+        swings = combat.swing_damage(combat.stats(attackers))
+
+        for unit, swing in zip(attackers, swings):
+            moves = reachability.get(solids, int(unit.x), int(unit.y), movement_kind(unit))
+
+            # spread out from every tile it can stand on; attacks ignore what's in the way
+            reach = path.maxarray(shape, np.int32)
+            reach[moves <= unit.max_move] = 0
+            path.dijkstra2d(reach, everywhere, 1, 0, out=reach)
+
+            hits = reach <= weapon_range(unit)
+
+            self.threat += hits
+            self.damage += hits * swing
+
+        self.revision += 1
+
+    def tiles(self):
+        # (x, y, attackers) for every tile something can hit
+        ys, xs = np.nonzero(self.threat)
+        return list(zip(xs.tolist(), ys.tolist(), self.threat[ys, xs].tolist()))
@@ -0,0 +1,259 @@
+import itertools
+import numpy as np
+
+from tcod import path
+
+from .hpa import HierarchicalPathfinder, UNREACHABLE
+
+# shared so two maps never hand out the same revision
+_revisions = itertools.count(1)
+
+WALKABLE = (0, 4)
+
+# movement cost multipliers per scenery code for each kind of unit
+CLASS_COSTS = {
+    "heavy": {4: 2}, # bridges are slow going under heavy units
+}
+
+# maps with more tiles than this route long paths through the cluster graph
+HIERARCHICAL_AREA = 64 * 64
+
+def movement_kind(unit):
+    return "heavy" if unit.heavy else None
+
+class SolidsMap:
+    def __init__(self, nature, world_size, move_costs=None):
+        self.width, self.height = world_size
+
+        # per-tile costs from the level, 1 everywhere unless it says otherwise
+        if move_costs is None:
+            self.move_costs = np.ones((self.height, self.width), np.int16)
+        else:
+            self.move_costs = np.maximum(np.asarray(move_costs, np.int16).reshape(self.height, self.width), 1)
+
+        self.occupied = np.zeros((self.height, self.width), np.int8)
+        self.finders = {}
+        self.hierarchies = {}
+        self.costs = {}
+        self.graphs = {}
+        self.set_terrain(nature)
+
+    def touch(self, *tiles):
+        self.revision = next(_revisions)
+        self.costs.clear()
+        self.graphs.clear()
+        self.finders.clear()
+
+        # the cluster graphs only redo the clusters around what changed
+        for hierarchy in self.hierarchies.values():
+            if tiles:
+                for x, y in tiles:
+                    hierarchy.touch(x, y)
+            else:
+                hierarchy.touch_all()
+
+    def set_terrain(self, nature):
+        self.nature = np.asarray(nature).reshape(self.height, self.width)
+        self.terrain = np.isin(self.nature, WALKABLE)
+
+        # cost fields only change with the level, not with the units on it
+        self.fields = {}
+
+        self.touch()
+
+    def occupy(self, units):
+        self.occupied[:] = 0
+        for unit in units:
+            self.occupied[int(unit.y), int(unit.x)] += 1
+        self.touch()
+
+    def add(self, x, y):
+        self.occupied[int(y), int(x)] += 1
+        self.touch((x, y))
+
+    def remove(self, x, y):
+        self.occupied[int(y), int(x)] -= 1
+        self.touch((x, y))
+
+    def move(self, x0, y0, x1, y1):
+        self.occupied[int(y0), int(x0)] -= 1
+        self.occupied[int(y1), int(x1)] += 1
+        self.touch((x0, y0), (x1, y1))
+
+    def field(self, kind=None):
+        # what entering each walkable tile costs this kind of unit, ignoring who stands where
+        field = self.fields.get(kind)
+
+        if field is None:
+            field = self.move_costs * self.terrain
+
+            for code, multiplier in CLASS_COSTS.get(kind, {}).items():
+                field = np.where(self.nature == code, field * multiplier, field)
+
+            field = field.astype(np.int16)
+            field.flags.writeable = False
+
+            self.fields[kind] = field
+
+        return field
+
+    def cost_for(self, kind=None):
+        cost = self.costs.get(kind)
+
+        if cost is None:
+            cost = self.field(kind) * (self.occupied == 0)
+            cost.flags.writeable = False
+
+            self.costs[kind] = cost
+
+        return cost
+
+    @property
+    def cost(self):
+        return self.cost_for(None)
+
+    def graph_for(self, kind=None):
+        # only rebuilt after something actually changed
+        graph = self.graphs.get(kind)
+
+        if graph is None:
+            graph = path.SimpleGraph(cost=self.cost_for(kind), cardinal=1, diagonal=0)
+            self.graphs[kind] = graph
+
+        return graph
+
+    @property
+    def graph(self):
+        return self.graph_for(None)
+
+    def path_to(self, x0, y0, x1, y1, kind=None):
+        if self.width * self.height > HIERARCHICAL_AREA:
+            hierarchy = self.hierarchies.get(kind)
+
+            if hierarchy is None:
+                hierarchy = HierarchicalPathfinder(self, kind)
+                self.hierarchies[kind] = hierarchy
+
+            return hierarchy.path_to(x0, y0, x1, y1)
+
+        # one pathfinder per root for this revision; tcod keeps its frontier between goals
+        root = (int(y0), int(x0), kind)
+        finder = self.finders.get(root)
+
+        if finder is None:
+            finder = path.Pathfinder(self.graph_for(kind))
+            finder.add_root(root[:2])
+
+            self.finders[root] = finder
+
+        return finder.path_to((int(y1), int(x1))).tolist()[1:]
+
+def distance_map(cost, x, y):
+    # movement spent getting from (x, y) to every tile, UNREACHABLE where no path exists
+    dist = path.maxarray(cost.shape, np.int32)
+    dist[y, x] = 0
+
+    return path.dijkstra2d(dist, cost, 1, 0, out=dist)
+
+class FlowField:
+    # steps from every tile to the nearest of a set of sources, shared by everyone heading for them
+    def __init__(self):
+        self.dist = None
+
+    def invalidate(self):
+        self.dist = None
+
+    def update(self, sources, solids):
+        if self.dist is not None:
+            return
+
+        # terrain only, so units walking around during the turn don't spoil it
+        dist = path.maxarray((solids.height, solids.width), np.int32)
+        for unit in sources:
+            dist[int(unit.y), int(unit.x)] = 0
+
+        self.dist = path.dijkstra2d(dist, solids.field(), 1, 0, out=dist)
+        self.dist.flags.writeable = False
+
+class ReachabilityCache:
+    def __init__(self):
+        self.board = None
+        self.maps = {}
+        self.moves = {}
+
+    def get(self, solids, x, y, kind=None):
+        # one weighted dijkstra pass per tile and kind of unit per board state;
+        # any change to the board drops them all
+        if solids.revision != self.board:
+            self.maps.clear()
+            self.moves.clear()
+            self.board = solids.revision
+
+        dist = self.maps.get((x, y, kind))
+
+        if dist is None:
+            dist = distance_map(solids.cost_for(kind), x, y)
+            dist.flags.writeable = False
+
+            self.maps[(x, y, kind)] = dist
+
+        return dist
+
+    def reachable(self, solids, x, y, max_move, kind=None):
+        dist = self.get(solids, x, y, kind)
+
+        # the lists are shared out of the cache, so callers only read them
+        moves = self.moves.get((x, y, kind, max_move))
+
+        if moves is None:
+            mask = (dist > 0) & (dist <= max_move)
+
+            # (x, y) pairs, x-major like the old per-tile scan
+            moves = [tuple(p) for p in np.argwhere(mask.T).tolist()]
+
+            self.moves[(x, y, kind, max_move)] = moves
+
+        return moves
+
+if __name__ == "__main__":
+    # python -m scripts.pathing: the cluster graph has to find a way wherever dijkstra does,
+    # on a crowded map big enough to use it
+    import random
+
+    class Marker:
+        def __init__(self, x, y):
+            self.x, self.y = x, y
+
+    rng = random.Random(0)
+    w = h = 130
+
+    nature = [1 if rng.random() < 0.2 else 0 for _ in range(w * h)]
+    free = [(x, y) for y in range(h) for x in range(w) if nature[y * w + x] == 0]
+    units = [Marker(x, y) for x, y in rng.sample(free, 400)]
+
+    solids = SolidsMap(nature, (w, h))
+    solids.occupy(units)
+
+    checked = failed = 0
+
+    for unit in units:
+        dist = distance_map(solids.cost, unit.x, unit.y)
+
+        for _ in range(5):
+            gx, gy = rng.choice(free)
+            p = solids.path_to(unit.x, unit.y, gx, gy)
+
+            reachable = dist[gy, gx] < UNREACHABLE and (gx, gy) != (unit.x, unit.y)
+
+            # every step a neighbour of the last, ending on the goal
+            steps = [[unit.y, unit.x]] + p
+            walks = all(abs(a[0] - b[0]) + abs(a[1] - b[1]) == 1 for a, b in zip(steps, steps[1:]))
+
+            if bool(p) != reachable or (p and (not walks or p[-1] != [gy, gx])):
+                failed += 1
+                print(f"({unit.x}, {unit.y}) -> ({gx}, {gy}): dijkstra {dist[gy, gx]}, path {p[:4]}...")
+
+            checked += 1
+
+    print(f"{checked} paths, {failed} wrong")
+    raise SystemExit(1 if failed else 0)
@@ -0,0 +1,161 @@
+import os
+import sys
+import time
+import struct
+
+from .unit import ScoutUnit, SoldierUnit, HeavyUnit, Bori, Thumbtack, Toothpick, SewingNeedle, Match, PaperArmor, CardboardArmor, FoilArmor
+from .item import Potion
+from .battle import BattleState
+
+# a replay is a header (level, seed, party, inventory) and then one small record per action,
+# for both sides, in the order the game applied them:
+#
+#   header   b"TTRP", version, seed, level file name, party, inventory
+#   action   opcode (B), x (H), y (H); items use x for the item's place in the header inventory
+
+MAGIC = b"TTRP"
+# 2: attack rolls drawn five at a time by scripts/combat.py
+VERSION = 2
+
+OPCODES = ["place", "move", "attack", "item", "wait"]
+
+ACTION = struct.Struct("<BHH")
+
+# unit stats that carry over between battles, in header order
+STATS = ["max_health", "strength", "defense", "accuracy", "max_move", "max_action_points", "level", "xp", "xp_to_level_up"]
+
+# anything that can be named in a header
+CLASSES = {
+    cls.__name__: cls
+    for cls in (ScoutUnit, SoldierUnit, HeavyUnit, Bori, Thumbtack, Toothpick, SewingNeedle, Match, PaperArmor, CardboardArmor, FoilArmor, Potion)
+}
+
+def write_string(f, s):
+    b = s.encode()
+    f.write(struct.pack("<B", len(b)) + b)
+
+def read_string(f):
+    n, = struct.unpack("<B", f.read(1))
+    return f.read(n).decode()
+
+class ReplayWriter:
+    def __init__(self, path, level, seed, party, inventory):
+        # buffered, so recording an action is just a copy into memory
+        self.file = open(path, "wb", buffering=1 << 16)
+        self.items = list(inventory)
+
+        f = self.file
+        f.write(MAGIC + struct.pack("<BI", VERSION, seed))
+        write_string(f, level)
+
+        f.write(struct.pack("<B", len(party)))
+        for unit in party:
+            write_string(f, type(unit).__name__)
+            write_string(f, unit.name)
+            f.write(struct.pack(f"<{len(STATS)}H", *(getattr(unit, s) for s in STATS)))
+            write_string(f, type(unit.weapon).__name__ if unit.weapon else "")
+            write_string(f, type(unit.armor).__name__ if unit.armor else "")
+
+        f.write(struct.pack("<B", len(self.items)))
+        for k in self.items:
+            write_string(f, k.__name__)
+            # a count the engine can't use is as good as none, and keeps the header packable
+            f.write(struct.pack("<H", min(max(0, inventory[k]), 0xFFFF)))
+
+    def record(self, action):
+        kind, arg = action
+
+        if kind == "item":
+            x, y = self.items.index(arg), 0
+        elif arg is None:
+            x, y = 0, 0
+        else:
+            x, y = arg
+
+        self.file.write(ACTION.pack(OPCODES.index(kind), int(x), int(y)))
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+class Replay:
+    def __init__(self, level, seed, party, inventory, actions):
+        self.level = level
+        self.seed = seed
+        self.party = party
+        self.inventory = inventory
+        self.actions = actions
+
+def read_replay(path):
+    with open(path, "rb") as f:
+        if f.read(4) != MAGIC:
+            raise ValueError(f"{path} is not a replay")
+
+        version, seed = struct.unpack("<BI", f.read(5))
+        if version != VERSION:
+            raise ValueError(f"{path} is replay version {version}, expected {VERSION}")
+
+        level = read_string(f)
+
+        party = []
+        n, = struct.unpack("<B", f.read(1))
+        for _ in range(n):
+            cls, name = CLASSES[read_string(f)], read_string(f)
+
+            unit = cls(True, 0, 0, name)
+            for s, v in zip(STATS, struct.unpack(f"<{len(STATS)}H", f.read(2 * len(STATS)))):
+                setattr(unit, s, v)
+            unit.health = unit.max_health
+            unit.action_points = unit.max_action_points
+
+            weapon, armor = read_string(f), read_string(f)
+            unit.weapon = CLASSES[weapon]() if weapon else None
+            unit.armor = CLASSES[armor]() if armor else None
+
+            party.append(unit)
+
+        inventory = {}
+        n, = struct.unpack("<B", f.read(1))
+        for _ in range(n):
+            k = CLASSES[read_string(f)]
+            inventory[k], = struct.unpack("<H", f.read(2))
+
+        items = list(inventory)
+        actions = []
+
+        for op, x, y in ACTION.iter_unpack(f.read()):
+            kind = OPCODES[op]
+
+            if kind == "item":
+                actions.append((kind, items[x]))
+            elif kind == "wait":
+                actions.append((kind, None))
+            else:
+                actions.append((kind, (x, y)))
+
+    return Replay(level, seed, party, inventory, actions)
+
+def fast_forward(replay, levels=os.path.join("assets", "levels")):
+    # re-run the whole log on the headless engine and hand back the finished battle
+    battle = BattleState.from_file(os.path.join(levels, replay.level), replay.party, replay.inventory, replay.seed)
+
+    for action in replay.actions:
+        battle.apply(action)
+
+    return battle
+
+if __name__ == "__main__":
+    # python -m scripts.replay replays/some.ttr
+    for path in sys.argv[1:]:
+        replay = read_replay(path)
+
+        start = time.perf_counter()
+        battle = fast_forward(replay)
+        spent = time.perf_counter() - start
+
+        # battle.turn counts each side's turn; the game shows a player and enemy turn as one
+        print(f"{path}: {replay.level}, seed {replay.seed}, {len(replay.actions)} actions, winner {battle.winner}, "
+              f"{battle.turn // 2 + 1} turns ({battle.turn + 1} side turns) in {spent * 1000:.1f}ms "
+              f"({(battle.turn + 1) / max(spent, 1e-9):.0f} side turns/s)")
@@ -0,0 +1,29 @@
+import pygame
+
+class SurfacePool:
+    def __init__(self):
+        self.surfaces = {}
+
+        # surfaces allocated since the last end_frame, and how many the last finished frame made;
+        # pool misses count themselves, the caches and anything else that makes a surface mid-frame call count()
+        self.allocations = 0
+        self.frame_allocations = 0
+
+    def get(self, name, size, flags=0):
+        key = (name, size, flags)
+        surf = self.surfaces.get(key)
+
+        if surf is None:
+            surf = pygame.Surface(size, flags)
+            self.surfaces[key] = surf
+
+            self.count()
+
+        return surf
+
+    def count(self, n=1):
+        self.allocations += n
+
+    def end_frame(self):
+        self.frame_allocations = self.allocations
+        self.allocations = 0
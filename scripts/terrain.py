@@ -0,0 +1,23 @@
+import pygame
+
+class TerrainLayer:
+    def __init__(self, size):
+        self.size = size
+        self.surf = None
+        self.key = None
+
+    def invalidate(self):
+        self.key = None
+
+    def draw(self, win, key, bake):
+        # re-bake only when the camera or the level changed, otherwise it's one blit
+        if self.key != key:
+            if self.surf is None:
+                self.surf = pygame.Surface(self.size, pygame.SRCALPHA)
+
+            self.surf.fill((0, 0, 0, 0))
+            bake(self.surf)
+
+            self.key = key
+
+        win.blit(self.surf, (0, 0))
@@ -0,0 +1,69 @@
+import pygame
+import numpy as np
+
+from collections import OrderedDict
+
+class TextCache:
+    def __init__(self, capacity=256, pool=None):
+        self.capacity = capacity
+        # a SurfacePool to report renders to, if anyone's counting
+        self.pool = pool
+        self.surfaces = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, color, shadow=0, shadow_color='black'):
+        key = (font, text, color, shadow, shadow_color)
+        surf = self.surfaces.get(key)
+
+        if surf is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surf
+
+        self.misses += 1
+
+        if self.pool is not None:
+            self.pool.count()
+
+        if shadow:
+            surf = composite_shadow(font, text, color, shadow_color, shadow)
+        else:
+            surf = font.render(text, True, color)
+
+        self.surfaces[key] = surf
+
+        while len(self.surfaces) > self.capacity:
+            self.surfaces.popitem(last=False)
+
+        return surf
+
+    def clear(self):
+        self.surfaces.clear()
+
+def composite_shadow(font, text, color, shadow_color, offset):
+    # blitting onto a transparent surface darkens the edges, so do the "over" blend by hand
+    shadow = font.render(text, True, shadow_color)
+    text = font.render(text, True, color)
+
+    w, h = text.get_size()
+
+    surf = pygame.Surface((w + offset, h + offset), pygame.SRCALPHA)
+
+    fg = np.zeros((w + offset, h + offset), np.float32)
+    bg = np.zeros((w + offset, h + offset), np.float32)
+    fg[:w, :h] = pygame.surfarray.array_alpha(text) / 255
+    bg[offset:, offset:] = pygame.surfarray.array_alpha(shadow) / 255
+
+    fg_color = np.array(pygame.Color(color))[:3].astype(np.float32)
+    bg_color = np.array(pygame.Color(shadow_color))[:3].astype(np.float32)
+
+    alpha = fg + bg * (1 - fg)
+    rgb = fg[..., None] * fg_color + (bg * (1 - fg))[..., None] * bg_color
+    rgb /= np.maximum(alpha, 1e-6)[..., None]
+
+    pygame.surfarray.pixels3d(surf)[:] = rgb.round().astype(np.uint8)
+    pygame.surfarray.pixels_alpha(surf)[:] = (alpha * 255).round().astype(np.uint8)
+
+    return surf
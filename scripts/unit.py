@@ -197,7 +197,7 @@ class Unit:
 
         return False
 
-    def give_xp(self, value):
+    def give_xp(self, value, rng=random):
         self.xp += value
 
         if self.xp >= self.xp_to_level_up:
@@ -207,10 +207,10 @@ class Unit:
             self.level += 1
 
             # stats up
-            self.max_health += random.randint(1, 3)
-            self.strength += random.randint(1, 3)
-            self.defense += random.randint(1, 3)
-            self.accuracy += random.randint(1, 3)
+            self.max_health += rng.randint(1, 3)
+            self.strength += rng.randint(1, 3)
+            self.defense += rng.randint(1, 3)
+            self.accuracy += rng.randint(1, 3)
             
             return True
 